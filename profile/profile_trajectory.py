@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark adaptive sampling of trajectories."""
+
+import os
+from pyinstrument import Profiler
+import unittest
+# These environmental variables must be set before numpy is imported anywhere.
+os.environ["MKL_NUM_THREADS"] = "1"
+os.environ["NUMEXPR_NUM_THREADS"] = "1"
+os.environ["OMP_NUM_THREADS"] = "1"
+os.environ["OPENBLAS_NUM_THREADS"] = "1"
+import numpy as np  # noqa
+import tike.trajectory  # noqa
+
+
+def lissajous(t, a=0.1, b=0.13, r=64):
+    """Return a lissajous scan that speeds up and slows down."""
+    return np.zeros_like(t), r * np.sin(a * t), r * np.cos(b * t)
+
+
+class BenchmarkTrajectory(unittest.TestCase):
+    """Run benchmarks for trajectory discretization."""
+
+    def setUp(self):
+        """Create a profiler."""
+        self.profiler = Profiler()
+
+    def test_discrete_trajectory(self):
+        """Use pyinstrument to benchmark discretizing 10^7 samples."""
+        self.profiler.start()
+        theta, v, h, dwell, times = tike.trajectory.discrete_trajectory(
+            lissajous,
+            tmin=0,
+            tmax=1e4,
+            xstep=0.01,
+            tstep=1,
+        )
+        self.profiler.stop()
+        print('\n')
+        print(f'{len(times):,d} samples')
+        print(self.profiler.output_text(unicode=True, color=True))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -44,19 +44,27 @@ def reconstruct(
         unaligned,
         algorithm,
         shift=None,
-        num_iter=1, rtol=-1, **kwargs
+        num_iter=1, rtol=-1, num_levels=1, **kwargs
 ):  # yapf: disable
     """Solve the alignment problem.
 
     Parameters
     ----------
-    unaligned : (..., H, W) complex64
-        The images to be aligned with data.
+    unaligned : (..., H, W) complex64 or float32
+        The images to be aligned with data. Real images stay real when data
+        is also real.
     shift : (..., 2), (..., H, W, 2) float32
         The inital guesses for the shifts.
+    num_iter : int
+        The number of times the solver refines the shifts at each level.
     rtol : float
         Terminate early if the relative decrease of the cost function is
         less than this amount.
+    num_levels : int
+        The number of levels of a coarse-to-fine image pyramid. Level k
+        averages blocks of 2^k by 2^k pixels. Shifts are estimated on the
+        coarsest level first and warm-start each finer level, so large
+        displacements are found in a fraction of the full resolution work.
 
     """
     if algorithm in solvers.__all__:
@@ -66,9 +74,14 @@ def reconstruct(
         # Initialize an operator.
         with Operator() as operator:
             # send any array-likes to device
-            data = operator.asarray(data, dtype='complex64')
-            unaligned = operator.asarray(unaligned, dtype='complex64')
-            result = {}
+            dtype = ('float32' if np.isrealobj(data)
+                     and np.isrealobj(unaligned) else 'complex64')
+            data = operator.asarray(data, dtype=dtype)
+            unaligned = operator.asarray(unaligned, dtype=dtype)
+            shift = kwargs.pop('flow', shift)
+            if shift is not None:
+                shift = operator.asarray(shift, dtype='float32')
+            result = {'cost': -1}
             for key, value in kwargs.items():
                 if np.ndim(value) > 0:
                     kwargs[key] = operator.asarray(value)
@@ -76,15 +89,95 @@ def reconstruct(
             logger.info("{} on {:,d} - {:,d} by {:,d} images for {:,d} "
                         "iterations.".format(algorithm, *data.shape, num_iter))
 
-            kwargs.update(result)
-            result = getattr(solvers, algorithm)(
-                operator,
-                data=data,
-                unaligned=unaligned,
-                **kwargs,
-            )
+            # Pixel axes of the shifts; flows have a shift per pixel
+            first = -3 if Operator is Flow else None
+            for level in range(num_levels - 1, -1, -1):
+                factor = 2**level
+                _data = _downsample(data, factor)
+                _unaligned = _downsample(unaligned, factor)
+                if shift is not None:
+                    shift = _downsample(shift, factor, first) / factor
+
+                cost = None
+                iterations = 0
+                for _ in range(num_iter):
+                    shift = _update(operator, algorithm, _data, _unaligned,
+                                    shift, **kwargs)
+                    iterations += 1
+                    # Check for early termination
+                    cost1 = operator.xp.linalg.norm(
+                        (operator.fwd(_unaligned, shift) - _data).ravel())**2
+                    result['cost'] = cost1
+                    if (cost is not None and rtol > 0
+                            and (cost - cost1) / cost < rtol):
+                        break
+                    cost = cost1
+
+                logger.info("level %d: %d iterations; cost %s", level,
+                            iterations, result['cost'])
+                if shift is not None:
+                    shift = _upsample(operator.xp, shift, factor, data.shape,
+                                      first) * factor
+            result['shift'] = shift
 
         return {k: operator.asnumpy(v) for k, v in result.items()}
     else:
         raise ValueError(
             "The '{}' algorithm is not an available.".format(algorithm))
+
+
+def _update(operator, algorithm, data, unaligned, shift, **kwargs):
+    """Return the shift refined by one call to the solver."""
+    if algorithm == 'farneback':
+        # Farneback refines an initial flow directly
+        return getattr(solvers, algorithm)(
+            operator,
+            data=data,
+            unaligned=unaligned,
+            flow=shift,
+            **kwargs,
+        )['shift']
+    # Other solvers find the residual shift after data is shifted back.
+    # Shifting data instead of unaligned keeps the edges that the shift
+    # fills with zeros aligned between the two.
+    if shift is not None:
+        data = operator.fwd(data, -shift)
+    residual = getattr(solvers, algorithm)(
+        operator,
+        data=data,
+        unaligned=unaligned,
+        **kwargs,
+    )['shift']
+    return residual if shift is None else shift + residual
+
+
+def _downsample(x, factor, first=-2):
+    """Return x averaged over blocks of factor by factor pixels.
+
+    The pixel axes of x are first and the one after it. Remainder pixels
+    that do not fill a block are dropped. When first is None, x has no pixel
+    axes and is returned unchanged.
+    """
+    if factor == 1 or first is None:
+        return x
+    i = first % x.ndim
+    h, w = x.shape[i] // factor, x.shape[i + 1] // factor
+    x = x[(slice(None),) * i + (slice(h * factor), slice(w * factor))]
+    x = x.reshape(*x.shape[:i], h, factor, w, factor, *x.shape[i + 2:])
+    return x.mean(axis=(i + 1, i + 3))
+
+
+def _upsample(xp, x, factor, shape, first=-2):
+    """Return x repeated into blocks of factor by factor pixels.
+
+    The inverse of _downsample; pixels dropped by _downsample are filled from
+    the nearest block.
+    """
+    if factor == 1 or first is None:
+        return x
+    i = first % x.ndim
+    x = x.repeat(factor, axis=i).repeat(factor, axis=i + 1)
+    pad = [(0, 0)] * x.ndim
+    pad[i] = (0, shape[-2] - x.shape[i])
+    pad[i + 1] = (0, shape[-1] - x.shape[i + 1])
+    return xp.pad(x, pad, mode='edge')
@@ -26,11 +26,13 @@
 """Implements a cross_correlation 2D alignment algorithm based on
 phase_cross_correlation from skimage.registration."""
 
+import functools
+
 import numpy as np
 
 
 def cross_correlation(op, data, unaligned, upsample_factor=1, space="real",
-                      **kwargs):  # yapf: disable
+                      chunk_size=None, **kwargs):  # yapf: disable
     """Efficient subpixel image translation alignment by cross-correlation.
 
     This code gives the same precision as the FFT upsampled cross-correlation
@@ -39,6 +41,15 @@ def cross_correlation(op, data, unaligned, upsample_factor=1, space="real",
     then refines the shift estimation by upsampling the DFT only in a small
     neighborhood of that estimate by means of a matrix-multiply DFT.
 
+    Parameters
+    ----------
+    data, unaligned (N, H, W)
+        The images to be aligned. When both are real and in real space, only
+        half of their spectra are computed.
+    chunk_size : int
+        The number of images registered at once. Bounds the temporary memory
+        for long stacks. By default, all images are registered at once.
+
     References
     ----------
     Stéfan van der Walt, Johannes L. Schönberger, Juan Nunez-Iglesias,
@@ -54,21 +65,46 @@ def cross_correlation(op, data, unaligned, upsample_factor=1, space="real",
     James R. Fienup, "Invariant error metrics for image reconstruction"
     Optics Letters 36, 8352-8357 (1997). :doi:`10.1364/AO.36.008352`
     """
+    if space.lower() not in ('fourier', 'real'):
+        raise ValueError(f"space must be 'fourier' or 'real' not '{space}'.")
+    chunk_size = len(data) if chunk_size is None else chunk_size
+    shifts = [
+        _register(
+            op,
+            data[lo:lo + chunk_size],
+            unaligned[lo:lo + chunk_size],
+            upsample_factor,
+            space.lower(),
+        ) for lo in range(0, len(data), chunk_size)
+    ]
+    return {'shift': op.xp.concatenate(shifts, axis=0), 'cost': -1}
+
+
+def _register(op, data, unaligned, upsample_factor, space):
+    """Return the shifts from unaligned to data for one chunk of images."""
+    shape = data.shape
+    real = (space == 'real' and not op.xp.iscomplexobj(data)
+            and not op.xp.iscomplexobj(unaligned))
     # assume complex data is already in Fourier space
-    if space.lower() == 'fourier':
+    if space == 'fourier':
         src_freq = data
         target_freq = unaligned
-    # real data needs to be fft'd.
-    elif space.lower() == 'real':
+    # real images only need half of their spectra
+    elif real:
+        src_freq = op.xp.fft.rfft2(data)
+        target_freq = op.xp.fft.rfft2(unaligned)
+    # complex data needs to be fft'd.
+    else:
         src_freq = op.xp.fft.fft2(data)
         target_freq = op.xp.fft.fft2(unaligned)
-    else:
-        raise ValueError(f"space must be 'fourier' or 'real' not '{space}'.")
 
     # Whole-pixel shift - Compute cross-correlation by an IFFT
-    shape = src_freq.shape
     image_product = src_freq * target_freq.conj()
-    cross_correlation = op.xp.fft.ifft2(image_product)
+    del src_freq, target_freq
+    if real:
+        cross_correlation = op.xp.fft.irfft2(image_product, s=shape[1:])
+    else:
+        cross_correlation = op.xp.fft.ifft2(image_product)
     A = np.abs(cross_correlation)
     maxima = A.reshape(A.shape[0], -1).argmax(1)
     maxima = np.column_stack(np.unravel_index(maxima, A[0, :, :].shape))
@@ -83,20 +119,22 @@ def cross_correlation(op, data, unaligned, upsample_factor=1, space="real",
     if upsample_factor > 1:
         # Initial shift estimate in upsampled grid
         shifts = np.round(shifts * upsample_factor) / upsample_factor
-        upsampled_region_size = np.ceil(upsample_factor * 1.5)
+        upsampled_region_size = int(np.ceil(upsample_factor * 1.5))
         # Center of output array at dftshift + 1
         dftshift = np.fix(upsampled_region_size / 2.0)
 
-        normalization = (src_freq[0].size * upsample_factor**2)
+        normalization = (shape[1] * shape[2] * upsample_factor**2)
         # Matrix multiply DFT around the current shift estimate
 
         sample_region_offset = dftshift - shifts * upsample_factor
         cross_correlation = _upsampled_dft(
             op,
             image_product.conj(),
+            shape[1:],
             upsampled_region_size,
             upsample_factor,
             sample_region_offset,
+            real=real,
         ).conj()
         cross_correlation /= normalization
         # Locate maximum and map back to original pixel grid
@@ -105,17 +143,46 @@ def cross_correlation(op, data, unaligned, upsample_factor=1, space="real",
         maxima = np.column_stack(np.unravel_index(maxima, A[0, :, :].shape))
         maxima = maxima - dftshift
         shifts = shifts + maxima / upsample_factor
-    return {'shift': shifts.astype('float32'), 'cost': -1}
+    return shifts.astype('float32')
+
+
+@functools.lru_cache(maxsize=16)
+def _dft_basis(xp, n, ups, upsample_factor, real=False):
+    """Return the frequencies and upsampled DFT basis for an axis of size n.
+
+    The basis is shared by all images; each image adds its own offset as a
+    phase ramp on the data. For real data, the basis spans the half spectrum
+    of rfft and is weighted to account for the missing conjugate half.
+    """
+    if real:
+        freq = xp.fft.rfftfreq(n, upsample_factor)
+    else:
+        freq = xp.fft.fftfreq(n, upsample_factor)
+    basis = xp.exp(-2j * np.pi * xp.arange(ups)[:, None] * freq)
+    if real:
+        # Frequencies other than zero and Nyquist stand for a conjugate pair
+        basis[:, 1:(n + 1) // 2] *= 2
+    return freq, basis
+
 
+def _upsampled_dft(op, data, shape, ups, upsample_factor, axis_offsets,
+                   real=False):  # yapf: disable
+    """Return the DFT of data upsampled near each axis_offset.
 
-def _upsampled_dft(op, data, ups, upsample_factor, axis_offsets):
+    The DFT along each axis is a matrix product with a cached basis after
+    shifting each image by its offset.
+    """
     im2pi = -2j * np.pi
-    shape = data.shape
-    kernel = ((op.xp.arange(ups) - axis_offsets[:, 1:2])[:, :, None] *
-              op.xp.fft.fftfreq(shape[2], upsample_factor))
-    kernel = np.exp(im2pi * kernel)
-    data = np.einsum('ijk,ipk->ijp', kernel, data)
-    kernel = ((op.xp.arange(ups) - axis_offsets[:, 0:1])[:, :, None] *
-              op.xp.fft.fftfreq(shape[1], upsample_factor))
-    kernel = np.exp(im2pi * kernel)
-    return np.einsum('ijk,ipk->ijp', kernel, data)
+    offsets = op.xp.asarray(axis_offsets, dtype='float64')
+    # Last axis; it is the half spectrum for real data
+    freq, basis = _dft_basis(op.xp, shape[1], ups, upsample_factor, real)
+    ramp = np.exp(-im2pi * offsets[:, 1:2] * freq)
+    data = (data * ramp[:, None, :]) @ basis.T
+    # First axis
+    freq, basis = _dft_basis(op.xp, shape[0], ups, upsample_factor)
+    ramp = np.exp(-im2pi * offsets[:, 0:1] * freq)
+    data = basis @ (ramp[:, :, None] * data)
+    if real:
+        # The spectrum of real data is Hermitian, so its DFT is real
+        return data.real
+    return data
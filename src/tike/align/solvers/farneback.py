@@ -1,28 +1,73 @@
 """Implements a 2D alignmnent algorithm by Gunnar Farneback."""
 
+import os
+
 import numpy as np
 from cv2 import calcOpticalFlowFarneback
 
+from tike.pool import NumPyThreadPool
+
 
-def _rescale_8bit(a, b):
-    """Return a, b rescaled into the same 8-bit range"""
+def _rescale_8bit(a, b, bins=1000):
+    """Return a, b rescaled into the same 8-bit range.
 
-    h, e = np.histogram(a, 1000)
-    stend = np.where(h > np.max(h) * 0.005)
-    st = stend[0][0]
-    end = stend[0][-1]
-    lo = e[st]
-    hi = e[end + 1]
+    The range is chosen separately for each image in the stack from a
+    histogram of a: it spans the bins which hold more than 0.5 percent of the
+    fullest bin. The histograms of the whole stack are computed at once and
+    match numpy.histogram. Values which are not finite are left out of the
+    histograms.
+
+    Parameters
+    ----------
+    a, b (L, M, N) float32
+        The stacks of images to rescale. They are modified in place.
+    """
+    flat = a.reshape(len(a), -1)
+    finite = np.isfinite(flat)
+    # Like numpy.histogram, bin in the precision of the images
+    dtype = np.result_type(flat, float) if np.issubdtype(
+        flat.dtype, np.integer) else flat.dtype
+    lo = np.min(flat, axis=1, initial=np.inf, where=finite).astype(dtype)
+    hi = np.max(flat, axis=1, initial=-np.inf, where=finite).astype(dtype)
+    # Images without finite values are binned like zeros
+    empty = lo > hi
+    lo[empty] = 0
+    hi[empty] = 0
+    # Like numpy.histogram, widen the range of constant images
+    constant = lo == hi
+    lo[constant] -= 0.5
+    hi[constant] += 0.5
+    edges = np.linspace(lo, hi, bins + 1, axis=1, dtype=dtype)
+
+    # Like numpy.histogram, compute the bins and then correct the values that
+    # were rounded into a neighboring bin
+    rows = np.arange(len(a))[:, None]
+    x = np.where(finite, flat, lo[:, None])
+    index = ((x - lo[:, None]) / (hi - lo)[:, None] * bins).astype('intp')
+    np.clip(index, 0, bins - 1, out=index)
+    index[x < edges[rows, index]] -= 1
+    index[(x >= edges[rows, index + 1]) & (index != bins - 1)] += 1
+    del x
+    # One histogram per image with a single bincount; the extra bin of each
+    # image collects the values which are not finite
+    index[~finite] = bins
+    index += rows * (bins + 1)
+    h = np.bincount(index.ravel(), minlength=len(a) * (bins + 1))
+    h = h.reshape(-1, bins + 1)[:, :bins]
+    del index
+
+    stend = h > np.max(h, axis=1, keepdims=True) * 0.005
+    st = np.argmax(stend, axis=1)
+    end = bins - 1 - np.argmax(stend[:, ::-1], axis=1)
+    hi = edges[rows[:, 0], end + 1][:, None, None]
+    lo = edges[rows[:, 0], st][:, None, None]
 
     # Force all values into range [0, 255]
-    a = (255 * (a - lo) / (hi - lo))
-    b = (255 * (b - lo) / (hi - lo))
-    a[a < 0] = 0
-    a[a > 255] = 255
-    b[b < 0] = 0
-    b[b > 255] = 255
-    assert np.all(a >= 0), np.all(b >= 0)
-    assert np.all(a <= 255), np.all(b <= 255)
+    scale = 255 / (hi - lo)
+    for x in (a, b):
+        x -= lo
+        x *= scale
+        np.clip(x, 0, 255, out=x)
     return a, b
 
 
@@ -37,6 +82,8 @@ def farneback(
     poly_n=5,
     poly_sigma=1.1,
     flow=None,
+    num_workers=None,
+    chunk_size=16,
     **kwargs,
 ):
     """Find the flow from unaligned to data using Farneback's algorithm
@@ -50,6 +97,11 @@ def farneback(
         The images to be aligned.
     flow : (L, M, N, 2) float32
         The inital guess for the displacement field.
+    num_workers : int
+        The number of threads which align images concurrently. OpenCV
+        releases the GIL, so the default is one thread per CPU.
+    chunk_size : int
+        The number of images rescaled together by each thread.
 
     References
     ----------
@@ -63,18 +115,29 @@ def farneback(
     else:
         flow = np.copy(np.flip(flow, axis=-1))
 
-    # NOTE: Passing a reshaped view as any of the parameters breaks OpenCV's
-    # Farneback implementation.
-    for i in range(len(data)):
-        flow[i] = calcOpticalFlowFarneback(
-            *_rescale_8bit(np.abs(unaligned[i]), np.abs(data[i])),
-            flow=flow[i],
-            pyr_scale=pyr_scale,
-            levels=levels,
-            winsize=winsize,
-            iterations=iterations,
-            poly_n=poly_n,
-            poly_sigma=poly_sigma,
-            flags=4,
-        )[..., ::-1]
+    def align_chunk(lo):
+        hi = min(lo + chunk_size, len(data))
+        a, b = _rescale_8bit(
+            np.abs(unaligned[lo:hi]).astype('float32'),
+            np.abs(data[lo:hi]).astype('float32'),
+        )
+        # NOTE: Passing a reshaped view as any of the parameters breaks
+        # OpenCV's Farneback implementation.
+        for i in range(hi - lo):
+            flow[lo + i] = calcOpticalFlowFarneback(
+                a[i],
+                b[i],
+                flow=flow[lo + i],
+                pyr_scale=pyr_scale,
+                levels=levels,
+                winsize=winsize,
+                iterations=iterations,
+                poly_n=poly_n,
+                poly_sigma=poly_sigma,
+                flags=4,
+            )[..., ::-1]
+
+    num_workers = os.cpu_count() if num_workers is None else num_workers
+    with NumPyThreadPool(num_workers) as pool:
+        list(pool.map(align_chunk, range(0, len(data), chunk_size)))
     return {'shift': flow, 'cost': -1}
@@ -0,0 +1,152 @@
+"""Search the parameters of scanning trajectories for uniform coverage.
+
+A candidate is a set of keyword arguments for a trajectory function such as
+the ones in :py:mod:`tike.scan`. Each candidate is sampled at regular times
+and scored by the uniformity of its coverage of the sinogram space, the
+length of its path, and the time it takes to visit every part of that space.
+Candidates are scored in parallel processes and ranked by a weighted cost.
+
+"""
+
+__author__ = "Daniel Ching"
+__copyright__ = "Copyright (c) 2020, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+__all__ = [
+    'score',
+    'search',
+]
+
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import itertools
+import logging
+import os
+
+import numpy as np
+
+from tike.scan import distance
+from tike.trajectory import bin_index, coverage
+
+logger = logging.getLogger(__name__)
+
+
+def score(
+        trajectory, params, tmin, tmax, tstep,
+        bins=[16, 8, 4], probe_grid=[[1]], probe_shape=(0, 0),
+        weights=(1, 0, 0),
+):  # yapf: disable
+    """Return the scores of a trajectory sampled every tstep in [tmin, tmax).
+
+    Parameters
+    ----------
+    trajectory : function(t, **params) -> theta, v, h
+        A function of time which returns the position of the probe. Functions
+        which return only v, h are scanned at theta = 0.
+    params : dict
+        The keyword arguments of the trajectory.
+    bins, probe_grid, probe_shape
+        The sinogram space and probe; see :py:func:`tike.trajectory.coverage`.
+    weights : (3, ) float
+        The weights of the coverage, distance, and time scores in the cost.
+
+    Returns
+    -------
+    scores : dict
+        'coverage' is the relative standard deviation of the coverage of the
+        bins; zero is perfectly uniform. 'distance' is the length of the path
+        travelled. 'time' is the time after tmin when the center of the probe
+        has visited every bin; infinite if it never does. 'cost' is the
+        weighted sum of the three.
+
+    """
+    t = np.arange(tmin, tmax, tstep)
+    position = trajectory(t=t, **params)
+    if len(position) == 2:
+        position = (np.zeros_like(t), *position)
+    theta, v, h = position
+
+    H = coverage(theta, v, h, bins=bins, probe_grid=probe_grid,
+                 probe_shape=probe_shape)
+    uniformity = np.std(H) / np.mean(H) if np.any(H) else np.inf
+
+    # Find the first time each bin is visited
+    index, inside = bin_index(theta % np.pi, 0, np.pi, bins[0])
+    for x, n in zip((v, h), bins[1:]):
+        i, within = bin_index(x, -.5, .5, n)
+        index = index * n + i
+        inside = inside & within
+    visited, first = np.unique(index[inside], return_index=True)
+    if visited.size == np.prod(bins):
+        time = t[inside][np.max(first)] - tmin
+    else:
+        time = np.inf
+
+    scores = {
+        'coverage': uniformity,
+        'distance': distance(theta, v, h),
+        'time': time,
+    }
+    # Skip unweighted scores; they may be infinite
+    scores['cost'] = sum(w * s for w, s in zip(weights, scores.values()) if w)
+    return scores
+
+
+def search(trajectory, candidates, tmin, tmax, tstep, num_best=1,
+           num_workers=None, **kwargs):  # yapf: disable
+    """Return the candidate trajectories with the least cost.
+
+    Parameters
+    ----------
+    trajectory : function(t, **params) -> theta, v, h
+        A function of time which returns the position of the probe. It must
+        be importable from a module so that it can be sent to other processes.
+    candidates : dict or iterable of dict
+        The keyword arguments of the trajectory to try. A dict of sequences
+        is the grid of all of their combinations.
+    num_best : int
+        The number of candidates to return.
+    num_workers : int
+        The number of processes which score candidates. Defaults to one per
+        CPU; with one, candidates are scored in this process.
+    kwargs
+        Passed to :py:func:`score`.
+
+    Returns
+    -------
+    best : list of (dict, dict)
+        The parameters and scores of the best candidates; least cost first.
+
+    """
+    if isinstance(candidates, dict):
+        names = list(candidates.keys())
+        candidates = [
+            dict(zip(names, values))
+            for values in itertools.product(*candidates.values())
+        ]
+    else:
+        candidates = list(candidates)
+    num_workers = os.cpu_count() if num_workers is None else num_workers
+    logger.info("Scoring {:,d} candidates with {:,d} workers.".format(
+        len(candidates), num_workers))
+
+    score_candidate = functools.partial(
+        score,
+        trajectory,
+        tmin=tmin,
+        tmax=tmax,
+        tstep=tstep,
+        **kwargs,
+    )
+    if num_workers > 1:
+        with ProcessPoolExecutor(num_workers) as pool:
+            scores = list(
+                pool.map(
+                    score_candidate,
+                    candidates,
+                    chunksize=max(1, len(candidates) // (4 * num_workers)),
+                ))
+    else:
+        scores = list(map(score_candidate, candidates))
+
+    order = np.argsort([s['cost'] for s in scores], kind='stable')
+    return [(candidates[i], scores[i]) for i in order[:num_best]]
@@ -67,9 +67,19 @@ def simulate(
         obj,
         theta,
         tilt,
+        out=None,
         **kwargs
 ):  # yapf: disable
-    """Return complex values of simulated laminography data."""
+    """Return complex values of simulated laminography data.
+
+    Parameters
+    ----------
+    out : (ntheta, n, n) complex64, optional
+        An array on the host, such as a numpy.memmap, into which the data is
+        written one chunk of angles at a time. Combine with the `chunk_size`
+        parameter of :py:class:`.operators.Lamino` to simulate more data than
+        fits in device memory.
+    """
     assert obj.ndim == 3
     assert theta.ndim == 1
     with Lamino(
@@ -78,9 +88,12 @@ def simulate(
             tilt=tilt,
             **kwargs,
     ) as operator:
-        data = operator.fwd(u=operator.asarray(obj, dtype='complex64'))
+        data = operator.fwd(
+            u=operator.asarray(obj, dtype='complex64'),
+            out=out,
+        )
         assert data.dtype == 'complex64', data.dtype
-        return operator.asnumpy(data)
+        return data if out is not None else operator.asnumpy(data)
 
 
 def reconstruct(
@@ -112,8 +125,10 @@ def reconstruct(
             eps=1e-3,
             **kwargs,
         ) as operator:
-            # send any array-likes to device
-            data = operator.asarray(data, dtype='complex64')
+            # send any array-likes to device; memory-mapped data stays on the
+            # host and is copied to the device one chunk of angles at a time
+            if not isinstance(data, np.memmap):
+                data = operator.asarray(data, dtype='complex64')
             result = {
                 'obj': operator.asarray(obj, dtype='complex64'),
             }
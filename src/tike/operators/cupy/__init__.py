@@ -12,6 +12,7 @@ from .operator import *
 from .propagation import *
 from .ptycho import *
 from .shift import *
+from .tomo import *
 
 __all__ = (
     'Convolution',
@@ -21,5 +22,5 @@ __all__ = (
     'Propagation',
     'Ptycho',
     'Shift',
-    # 'Tomo',
+    'Tomo',
 )
@@ -2,15 +2,16 @@ __author__ = "Daniel Ching"
 __copyright__ = "Copyright (c) 2020, UChicago Argonne, LLC."
 
 import cupy as cp
-from cupyx.scipy.fft import fftn, ifftn
+from cupyx.scipy.fft import fftn, ifftn, irfftn, rfftn
 from cupyx.scipy.fftpack import get_fft_plan
 
 
 class CachedFFT():
     """Provides a multi-plan cache for CuPy FFT.
 
-    A class which inherits from this class gains the _fft2, _fftn, and _ifft2
-    methods which provide automatic plan caching for the CuPy FFTs.
+    A class which inherits from this class gains the _fft2, _fftn, _ifft2,
+    _ifftn, _rfft2, and _irfft2 methods which provide automatic plan caching
+    for the CuPy FFTs.
     """
 
     def __enter__(self):
@@ -21,14 +22,17 @@ class CachedFFT():
         self.plan_cache.clear()
         del self.plan_cache
 
-    def _get_fft_plan(self, a, axes=None, **kwargs):
+    def _get_fft_plan(self, a, axes=None, s=None, value_type='C2C',
+                      **kwargs):
         """Cache multiple FFT plans at the same time."""
         axes = tuple(range(a.ndim)) if axes is None else axes
-        key = (*a.shape, *axes)
+        key = (*a.shape, *axes, value_type)
+        if s is not None:
+            key = (*key, *s)
         if key in self.plan_cache:
             plan = self.plan_cache[key]
         else:
-            plan = get_fft_plan(a, axes=axes)
+            plan = get_fft_plan(a, shape=s, axes=axes, value_type=value_type)
             self.plan_cache[key] = plan
         return plan
 
@@ -43,3 +47,15 @@ class CachedFFT():
     def _fftn(self, a, *args, overwrite=False, **kwargs):
         with self._get_fft_plan(a, **kwargs):
             return fftn(a, *args, overwrite_x=overwrite, **kwargs)
+
+    def _ifftn(self, a, *args, overwrite=False, **kwargs):
+        with self._get_fft_plan(a, **kwargs):
+            return ifftn(a, *args, overwrite_x=overwrite, **kwargs)
+
+    def _rfft2(self, a, *args, **kwargs):
+        with self._get_fft_plan(a, value_type='R2C', **kwargs):
+            return rfftn(a, *args, **kwargs)
+
+    def _irfft2(self, a, *args, **kwargs):
+        with self._get_fft_plan(a, value_type='C2R', **kwargs):
+            return irfftn(a, *args, **kwargs)
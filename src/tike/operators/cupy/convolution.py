@@ -1,9 +1,13 @@
 __author__ = "Daniel Ching, Viktor Nikitin"
 __copyright__ = "Copyright (c) 2020, UChicago Argonne, LLC."
 
+from collections import OrderedDict
+import threading
+
 from importlib_resources import files
 
 import cupy as cp
+import cupyx.scipy.sparse
 
 from .operator import Operator
 
@@ -11,6 +15,64 @@ _cu_source = files('tike.operators.cupy').joinpath('convolution.cu').read_text()
 _patch_kernel = cp.RawKernel(_cu_source, "patch")
 
 
+def _patch_matrix(xp, scan, probe_shape, nz, n, sparse):
+    """Return the bilinear patch extraction at scan as a sparse matrix.
+
+    The matrix has one row per pixel of the raveled (ntheta, nscan,
+    probe_shape, probe_shape) patches and one column per pixel of the raveled
+    (ntheta, nz, n) psi, and 4 non-zeros per row.
+
+    Raises
+    ------
+    ValueError
+        If the indices of the matrix do not fit in int32.
+    """
+    ntheta, nscan = scan.shape[:2]
+    nnz = ntheta * nscan * probe_shape**2 * 4
+    if max(nnz, ntheta * nz * n) >= 2**31:
+        raise ValueError(
+            f"The patch matrix of {nnz} non-zeros is too large to precompute.")
+    corner = xp.floor(scan)
+    frac = (scan - corner).astype('float32')
+    corner = corner.astype('int64')
+    pixel = xp.arange(probe_shape)
+    ids = (
+        (xp.arange(ntheta)[:, None, None, None] * nz
+         + corner[..., 0, None, None] + pixel[:, None]) * n
+        + corner[..., 1, None, None] + pixel
+    )  # yapf: disable
+    ids = ids[..., None] + xp.array([0, 1, n, n + 1])
+    fy, fx = frac[..., 0, None, None, None], frac[..., 1, None, None, None]
+    weights = xp.concatenate(
+        (
+            (1 - fy) * (1 - fx),
+            (1 - fy) * fx,
+            fy * (1 - fx),
+            fy * fx,
+        ),
+        axis=-1,
+    )
+    weights = xp.broadcast_to(weights, ids.shape)
+    return sparse.csr_matrix(
+        (
+            weights.ravel(),
+            ids.ravel().astype('int32'),
+            xp.arange(0, nnz + 1, 4, dtype='int32'),
+        ),
+        shape=(ntheta * nscan * probe_shape**2, ntheta * nz * n),
+    )
+
+
+def _scan_key(xp, scan):
+    """Return the shape and position-weighted checksums of a scan."""
+    weights = xp.arange(1, scan.size + 1, dtype='float64').reshape(scan.shape)
+    return (
+        scan.shape,
+        float(xp.sum(scan, dtype='float64')),
+        float(xp.sum(scan * weights)),
+    )
+
+
 class Convolution(Operator):
     """A 2D Convolution operator with linear interpolation.
 
@@ -34,19 +96,35 @@ class Convolution(Operator):
     psi : (ntheta, nz, n) complex64
         The complex wavefront modulation of the object.
     probe : complex64
-        The (ntheta, nscan // fly, fly, 1, probe_shape, probe_shape)
+        The (ntheta, nscan // fly, fly, nmode, probe_shape, probe_shape)
         complex illumination function.
     nearplane: complex64
-        The (ntheta, nscan // fly, fly, 1, probe_shape, probe_shape)
-        wavefronts after exiting the object.
+        The (ntheta, nscan // fly, fly, nmode, detector_shape,
+        detector_shape) wavefronts after exiting the object.
     scan : (ntheta, nscan, 2) float32
         Coordinates of the minimum corner of the probe grid for each
         measurement in the coordinate system of psi. Vertical coordinates
         first, horizontal coordinates second.
+    precompute : bool
+        Build the bilinear patch extraction as a sparse matrix the first time
+        a scan is used and reuse it for as long as the same positions are
+        used again. Matrices are found by a checksum of the positions, so a
+        scan which is changed in place gets a new matrix, and the matrices of
+        recently used scans are kept. Faster when the scan does not change
+        e.g. in object and probe updates, but the matrix needs probe_shape^2 *
+        32 bytes per position.
+    cache : bool
+        Whether to keep the matrix of a scan which is used only once, e.g.
+        the shifted scans of position updates, when precompute is True.
 
     """
+    plan_cache_size = 4
+    """Matrices are kept for at most this many times the positions of the
+    largest kept scan, e.g. for a scan and all of its batches."""
+
     def __init__(self, probe_shape, nz, n, ntheta, fly=1,
-                 detector_shape=None, **kwargs):  # yapf: disable
+                 detector_shape=None, precompute=False,
+                 **kwargs):  # yapf: disable
         self.probe_shape = probe_shape
         self.nz = nz
         self.n = n
@@ -58,43 +136,65 @@ class Convolution(Operator):
             self.detector_shape = detector_shape
         self.pad = (self.detector_shape - self.probe_shape) // 2
         self.end = self.probe_shape + self.pad
+        self.precompute = precompute
+        self.plans = OrderedDict()
+        self.plans_lock = threading.Lock()
 
-    def fwd(self, psi, scan, probe):
+    def __exit__(self, type, value, traceback):
+        """Gracefully handle interruptions or with-block exit."""
+        self.plans.clear()
+
+    def fwd(self, psi, scan, probe, cache=True):
         """Extract probe shaped patches from the psi at each scan position.
 
         The patches within the bounds of psi are linearly interpolated, and
-        indices outside the bounds of psi are not allowed.
+        indices outside the bounds of psi are not allowed. The patches are
+        extracted once and multiplied by all of the probe modes at once.
         """
         psi = psi.reshape(self.ntheta, self.nz, self.n)
         self._check_shape_probe(probe, scan.shape[-2])
         patches = self.xp.zeros(
-            (self.ntheta, scan.shape[-2], self.detector_shape,
-             self.detector_shape),
+            (self.ntheta, scan.shape[-2], self.probe_shape, self.probe_shape),
             dtype='complex64',
         )
-        patches = self._patch(patches, psi, scan, fwd=True)
+        patches = self._patch(patches, psi, scan, fwd=True, cache=cache)
         patches = patches.reshape(self.ntheta, scan.shape[-2] // self.fly,
-                                  self.fly, 1, self.detector_shape,
-                                  self.detector_shape)
-        patches[..., self.pad:self.end, self.pad:self.end] *= probe
-        return patches
+                                  self.fly, 1, self.probe_shape,
+                                  self.probe_shape)
+        nearplane = self.xp.zeros(
+            (*patches.shape[:3], probe.shape[-3], self.detector_shape,
+             self.detector_shape),
+            dtype='complex64',
+        )
+        self.xp.multiply(
+            patches,
+            probe,
+            out=nearplane[..., self.pad:self.end, self.pad:self.end],
+        )
+        return nearplane
 
     def adj(self, nearplane, scan, probe, psi=None, overwrite=False):
-        """Combine probe shaped patches into a psi shaped grid by addition."""
+        """Combine probe shaped patches into a psi shaped grid by addition.
+
+        The products of the modes of nearplane and probe are summed before
+        they are added to psi.
+        """
         self._check_shape_nearplane(nearplane, scan.shape[-2])
         self._check_shape_probe(probe, scan.shape[-2])
-        if not overwrite:
-            nearplane = nearplane.copy()
-        nearplane[..., self.pad:self.end, self.pad:self.end] *= probe.conj()
-        nearplane = nearplane.reshape(self.ntheta, scan.shape[-2],
-                                      self.detector_shape, self.detector_shape)
+        patches = self.xp.sum(
+            nearplane[..., self.pad:self.end, self.pad:self.end] *
+            probe.conj(),
+            axis=-3,
+        )
+        patches = patches.reshape(self.ntheta, scan.shape[-2],
+                                  self.probe_shape, self.probe_shape)
         if psi is None:
             psi = self.xp.zeros((self.ntheta, self.nz, self.n),
                                 dtype='complex64')
-        return self._patch(nearplane, psi, scan, fwd=False)
+        return self._patch(patches, psi, scan, fwd=False)
 
     def adj_probe(self, nearplane, scan, psi, overwrite=False):
-        """Combine probe shaped patches into a probe."""
+        """Combine probe shaped patches into a probe; one for each mode."""
         self._check_shape_nearplane(nearplane, scan.shape[-2])
         patches = self.xp.zeros(
             (self.ntheta, scan.shape[-2], self.probe_shape, self.probe_shape),
@@ -104,18 +204,18 @@ class Convolution(Operator):
         patches = patches.reshape(self.ntheta, scan.shape[-2] // self.fly,
                                   self.fly, 1, self.probe_shape,
                                   self.probe_shape)
-        patches = patches.conj()
-        patches *= nearplane[..., self.pad:self.end, self.pad:self.end]
-        return patches
+        return patches.conj() * nearplane[..., self.pad:self.end,
+                                          self.pad:self.end]
 
     def _check_shape_probe(self, x, nscan):
         """Check that the probe is correctly shaped."""
         assert type(x) is self.xp.ndarray, type(x)
         # unique probe for each position
-        shape1 = (self.ntheta, nscan // self.fly, self.fly, 1, self.probe_shape,
-                  self.probe_shape)
+        shape1 = (self.ntheta, nscan // self.fly, self.fly, x.shape[-3],
+                  self.probe_shape, self.probe_shape)
         # one probe for all positions
-        shape2 = (self.ntheta, 1, 1, 1, self.probe_shape, self.probe_shape)
+        shape2 = (self.ntheta, 1, 1, x.shape[-3], self.probe_shape,
+                  self.probe_shape)
         if __debug__ and x.shape != shape2 and x.shape != shape1:
             raise ValueError(
                 f"probe must have shape {shape1} or {shape2} not {x.shape}")
@@ -123,13 +223,50 @@ class Convolution(Operator):
     def _check_shape_nearplane(self, x, nscan):
         """Check that nearplane is correctly shaped."""
         assert type(x) is self.xp.ndarray, type(x)
-        shape1 = (self.ntheta, nscan // self.fly, self.fly, 1,
+        shape1 = (self.ntheta, nscan // self.fly, self.fly, x.shape[-3],
                   self.detector_shape, self.detector_shape)
         if __debug__ and x.shape != shape1:
             raise ValueError(
                 f"nearplane must have shape {shape1} not {x.shape}")
 
-    def _patch(self, patches, psi, scan, fwd=True):
+    def _get_matrix(self, scan, cache=True):
+        """Return the patch matrix for these scan positions; build it once.
+
+        If cache is False, a new matrix is not kept.
+        """
+        key = _scan_key(self.xp, scan)
+        with self.plans_lock:
+            if key in self.plans:
+                self.plans.move_to_end(key)
+                return self.plans[key]
+        matrix = _patch_matrix(self.xp, scan, self.probe_shape, self.nz,
+                               self.n, cupyx.scipy.sparse)
+        if not cache:
+            return matrix
+        with self.plans_lock:
+            self.plans[key] = matrix
+            while True:
+                sizes = [m.shape[0] for m in self.plans.values()]
+                if sum(sizes) <= self.plan_cache_size * max(sizes):
+                    break
+                self.plans.popitem(last=False)
+        return matrix
+
+    def _patch(self, patches, psi, scan, fwd=True, cache=True):
+        if self.precompute:
+            matrix = self._get_matrix(scan, cache)
+            # Real and imaginary parts are separate to avoid casting the
+            # matrix.
+            if fwd:
+                psi = psi.ravel()
+                patches[:] = (matrix @ psi.real + 1j *
+                              (matrix @ psi.imag)).reshape(patches.shape)
+                return patches
+            matrix = matrix.T
+            patches = patches.ravel()
+            psi += (matrix @ patches.real + 1j *
+                    (matrix @ patches.imag)).reshape(psi.shape)
+            return psi
         _patch_kernel = cp.RawKernel(_cu_source, "patch")
         max_thread = min(self.probe_shape,
                          _patch_kernel.attributes['max_threads_per_block'])
@@ -1,6 +1,8 @@
 __author__ = "Daniel Ching, Viktor Nikitin"
 __copyright__ = "Copyright (c) 2020, UChicago Argonne, LLC."
 
+import cupyx.scipy.sparse
+
 from .operator import Operator
 
 
@@ -8,60 +10,221 @@ def _lanczos(xp, x, a):
     return xp.sinc(x) * xp.sinc(x / a)
 
 
-def _remap_lanczos(xp, Fe, x, m, F=None):
+def _lanczos_weights(xp, x, m, shape):
+    """Return the separable flat grid indices and Lanczos weights.
+
+    The Lanczos filter is separable, so its weights are computed as two
+    vectors of 2m + 1 weights per sample instead of (2m + 1)^2 weights, and
+    the flat index of the grid point (i0, i1) of the filter is rows[..., i0] +
+    cols[..., i1].
+
+    Parameters
+    ----------
+    x : (S, N, 2) float32
+        The non-uniform sample positions on each grid of the stack.
+    shape : (S, H, W)
+        The shape of the stack of grids.
+
+    Returns
+    -------
+    rows : (S, N, 2m + 1) int64
+        The offsets of the rows of the raveled stack of grids covered by the
+        filter. At the edges, the Lanczos filter wraps around.
+    cols : (S, N, 2m + 1) int32
+        The columns covered by the filter.
+    weights : (S, N, 2, 2m + 1) float32
+        The filter weights along each dimension.
+    """
+    assert m > 0
+    # the integer center of the kernel; float32 so the weights stay float32
+    ell = xp.floor(x).astype('float32')
+    grid = ell[..., None] + xp.arange(-m, m + 1, dtype='float32')
+    weights = _lanczos(xp, grid - x[..., None], m).astype('float32')
+    grid = grid.astype('int32')
+    rows = (grid[..., 0, :] % shape[-2]).astype('int64') * shape[-1]
+    rows += xp.arange(shape[0])[:, None, None] * shape[-2] * shape[-1]
+    cols = grid[..., 1, :] % shape[-1]
+    return rows, cols, weights
+
+
+def _remap_lanczos(xp, Fe, x, m, F=None, chunk=None):
     """Lanczos resampling from grid Fe to points x.
 
-    At the edges, the Lanczos filter wraps around.
+    At the edges, the Lanczos filter wraps around. The stack is resampled
+    `chunk` grids at a time to bound the size of the temporary arrays.
 
     Parameters
     ----------
     xp : module
         The array module for this implementation
-    Fe : (H, W)
-        The function at equally spaced samples.
-    x : (N, 2) float32
-        The non-uniform sample positions on the grid.
+    Fe : (S, H, W)
+        The stack of functions at equally spaced samples.
+    x : (S, N, 2) float32
+        The non-uniform sample positions on each grid.
     m : int > 0
         The Lanczos filter is 2m + 1 wide.
+    chunk : int
+        The number of grids per chunk. Defaults to about 2^18 samples.
 
     Returns
     -------
-    F : (N, )
+    F : (S, N)
         The values at the non-uniform samples.
     """
     # NOTE: This irregular convolution is very similar to the gather function
     # from usfft
-    assert Fe.ndim == 2
-    assert x.ndim == 2 and x.shape[-1] == 2
-    assert m > 0
+    assert Fe.ndim == 3
+    assert x.ndim == 3 and x.shape[-1] == 2
     F = xp.zeros(x.shape[:-1], dtype=Fe.dtype) if F is None else F
     assert F.shape == x.shape[:-1], F.dtype == Fe.dtype
-    n = Fe.shape[-2:]
-    # ell is the integer center of the kernel
-    ell = xp.floor(x).astype('int32')
-    for i0 in range(-m, m + 1):
-        kern0 = _lanczos(xp, ell[..., 0] + i0 - x[..., 0], m)
-        for i1 in range(-m, m + 1):
-            kern1 = _lanczos(xp, ell[..., 1] + i1 - x[..., 1], m)
-            # Indexing Fe here causes problems for a stack of images
-            F += Fe[(ell[..., 0] + i0) % n[0],
-                    (ell[..., 1] + i1) % n[1]] * kern0 * kern1
+    chunk = max(1, 2**18 // x.shape[1]) if chunk is None else chunk
+    for lo in range(0, len(x), chunk):
+        hi = min(lo + chunk, len(x))
+        rows, cols, weights = _lanczos_weights(xp, x[lo:hi], m,
+                                               Fe[lo:hi].shape)
+        grids = Fe[lo:hi].ravel()
+        for i0 in range(2 * m + 1):
+            F[lo:hi] += weights[..., 0, i0] * xp.sum(
+                grids[rows[..., i0, None] + cols] * weights[..., 1, :],
+                axis=-1,
+            )
     return F
 
 
+def _remap_lanczos_adjoint(xp, F, x, m, shape, chunk=None):
+    """Scatter the points F at x to a stack of grids; adjoint of the remap.
+
+    The stack is scattered `chunk` grids at a time to bound the size of the
+    temporary arrays.
+
+    Parameters
+    ----------
+    F : (S, N)
+        The values at the non-uniform samples.
+    x : (S, N, 2) float32
+        The non-uniform sample positions on each grid.
+    shape : (S, H, W)
+        The shape of the stack of grids.
+    chunk : int
+        The number of grids per chunk. Defaults to about 2^18 samples.
+
+    Returns
+    -------
+    Fe : (S, H, W)
+        The stack of functions at equally spaced samples.
+    """
+    chunk = max(1, 2**18 // x.shape[1]) if chunk is None else chunk
+    Fe = xp.zeros(shape, dtype=F.dtype)
+    for lo in range(0, len(x), chunk):
+        hi = min(lo + chunk, len(x))
+        rows, cols, weights = _lanczos_weights(xp, x[lo:hi], m,
+                                               Fe[lo:hi].shape)
+        grids = Fe[lo:hi].reshape(-1)
+        for i0 in range(2 * m + 1):
+            vals = ((F[lo:hi] * weights[..., 0, i0])[..., None] *
+                    weights[..., 1, :])
+            index = (rows[..., i0, None] + cols).ravel()
+            grids += xp.bincount(index,
+                                 weights=vals.real.ravel(),
+                                 minlength=grids.size)
+            if xp.iscomplexobj(vals):
+                grids += 1j * xp.bincount(
+                    index, weights=vals.imag.ravel(), minlength=grids.size)
+    return Fe
+
+
+def _remap_matrix(xp, x, m, shape, sparse):
+    """Return the Lanczos remap from a stack of grids as a sparse matrix.
+
+    The matrix has one row per sample and one column per grid point of the
+    raveled stack, and (2m + 1)^2 non-zeros per row.
+
+    Raises
+    ------
+    ValueError
+        If the indices of the matrix do not fit in int32.
+    """
+    nk = (2 * m + 1)**2
+    nnz = x.shape[0] * x.shape[1] * nk
+    if max(nnz, shape[0] * shape[-2] * shape[-1]) >= 2**31:
+        raise ValueError(
+            f"The remap matrix of {nnz} non-zeros is too large to precompute."
+        )
+    rows, cols, weights = _lanczos_weights(xp, x, m, shape)
+    ids = rows[..., :, None] + cols[..., None, :]
+    data = weights[..., 0, :, None] * weights[..., 1, None, :]
+    return sparse.csr_matrix(
+        (
+            data.ravel(),
+            ids.ravel().astype('int32'),
+            xp.arange(0, nnz + 1, nk, dtype='int32'),
+        ),
+        shape=(x.shape[0] * x.shape[1], shape[0] * shape[-2] * shape[-1]),
+    )
+
+
+def _matvec(xp, matrix, x):
+    """Return matrix @ x with the real and imaginary parts of x separate."""
+    y = matrix @ x.real
+    if xp.iscomplexobj(x):
+        y = y + 1j * (matrix @ x.imag)
+    return y.astype(x.dtype)
+
+
 class Flow(Operator):
     """Map input 2D array to new coordinates by Lanczos interpolation.
 
     Uses Lanczos interpolation for a non-affine deformation of a series of 2D
     images.
+
+    Attributes
+    ----------
+    precompute : bool
+        Build the remap as a sparse matrix the first time a flow is applied
+        and reuse it for as long as the same flow array is applied again.
+        Faster when one flow is applied repeatedly e.g. in iterative solvers,
+        but the matrix needs (filter_size^2) * 8 bytes per pixel and at most
+        2^31 non-zeros. A flow array which is modified in place is detected
+        by a checksum of its values, so prefer applying a new array.
     """
 
+    def __init__(self, precompute=False):
+        """Please see help(Flow) for more info."""
+        self.precompute = precompute
+        self.matrix = None
+
+    def __exit__(self, type, value, traceback):
+        """Gracefully handle interruptions or with-block exit."""
+        self.matrix = None
+
+    def _coords(self, flow):
+        """Convert from displacements to coordinates."""
+        h, w = flow.shape[-3:-1]
+        coords = -flow.copy()
+        coords[..., 0] += self.xp.arange(h)[:, None]
+        coords[..., 1] += self.xp.arange(w)
+        return coords.reshape(-1, h * w, 2)
+
+    def _get_matrix(self, flow, shape, a):
+        """Return the remap matrix for this flow; build it once."""
+        checksum = (
+            float(self.xp.sum(flow)),
+            float(self.xp.sum(self.xp.square(flow))),
+        )
+        key = (flow, checksum, shape, a)
+        if (self.matrix is None or self.matrix[0] is not flow or
+                self.matrix[1:-1] != key[1:]):
+            self.matrix = (*key,
+                           _remap_matrix(self.xp, self._coords(flow), a,
+                                         shape, cupyx.scipy.sparse))
+        return self.matrix[-1]
+
     def fwd(self, f, flow, filter_size=5):
         """Remap individual pixels of f with Lanczos filtering.
 
         Parameters
         ----------
-        f (..., H, W) complex64
+        f (..., H, W) complex64 or float32
             A stack of arrays to be deformed.
         flow (..., H, W, 2) float32
             The displacements to be applied to each pixel along the last two
@@ -70,20 +233,44 @@ class Flow(Operator):
             The width of the Lanczos filter. Automatically rounded up to an
             odd positive integer.
         """
-        # Convert from displacements to coordinates
-        h, w = flow.shape[-3:-1]
-        coords = -flow.copy()
-        coords[..., 0] += self.xp.arange(h)[:, None]
-        coords[..., 1] += self.xp.arange(w)
-
         # Reshape into stack of 2D images
         shape = f.shape
-        coords = coords.reshape(-1, h * w, 2)
+        h, w = shape[-2:]
         f = f.reshape(-1, h, w)
-        g = self.xp.zeros_like(f).reshape(-1, h * w)
+        a = max(0, (filter_size) // 2)
+
+        if self.precompute:
+            matrix = self._get_matrix(flow, f.shape, a)
+            return _matvec(self.xp, matrix, f.ravel()).reshape(shape)
 
+        return _remap_lanczos(self.xp, f, self._coords(flow), a).reshape(shape)
+
+    def adj(self, g, flow, filter_size=5):
+        """Perform the adjoint of the remap of fwd.
+
+        Parameters
+        ----------
+        g (..., H, W) complex64 or float32
+            A stack of deformed arrays.
+        flow (..., H, W, 2) float32
+            The displacements which were applied to each pixel by fwd.
+        filter_size : int
+            The width of the Lanczos filter. Automatically rounded up to an
+            odd positive integer.
+        """
+        shape = g.shape
+        h, w = shape[-2:]
+        g = g.reshape(-1, h * w)
         a = max(0, (filter_size) // 2)
-        for i in range(len(f)):
-            _remap_lanczos(self.xp, f[i], coords[i], a, g[i])
 
-        return g.reshape(shape)
+        if self.precompute:
+            matrix = self._get_matrix(flow, (len(g), h, w), a).T
+            return _matvec(self.xp, matrix, g.ravel()).reshape(shape)
+
+        return _remap_lanczos_adjoint(
+            self.xp,
+            g,
+            self._coords(flow),
+            a,
+            (len(g), h, w),
+        ).reshape(shape)
@@ -1,16 +1,34 @@
 __author__ = "Daniel Ching, Viktor Nikitin"
 __copyright__ = "Copyright (c) 2020, UChicago Argonne, LLC."
 
+from collections import OrderedDict
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import warnings
+
 from importlib_resources import files
 
 import cupy as cp
+import cupyx.scipy.sparse
+import numpy as np
 
 from .cache import CachedFFT
-from .usfft import eq2us, us2eq, checkerboard
+from .usfft import (USFFTPlan, checkerboard_mask, interpolation_matrix,
+                    interpolation_nbytes, sparse_gather, sparse_scatter)
 from .operator import Operator
 
 _cu_source = files('tike.operators.cupy').joinpath('usfft.cu').read_text()
 
+logger = logging.getLogger(__name__)
+
+_grid_cache = OrderedDict()
+_grid_cache_lock = threading.Lock()
+_grid_cache_size = 4
+"""The maximum number of frequency grids kept in memory by this process."""
+
 
 class Lamino(CachedFFT, Operator):
     """A Laminography operator.
@@ -30,6 +48,29 @@ class Lamino(CachedFFT, Operator):
         The tilt angle; the angle between the rotation axis of the object and
         the light source. π / 2 for conventional tomography. 0 for a beam path
         along the rotation axis.
+    cache_dir : str, optional
+        A directory for saving and loading the unequally-spaced frequency grid
+        so that it is computed only once for each acquisition geometry.
+    precompute : bool
+        Build the USFFT interpolation as a sparse matrix the first time it is
+        needed and reuse it for every following transform. Much faster for
+        iterative methods, but the matrix needs (2m)^3 * 8 bytes per
+        frequency.
+    oversample : float
+        The oversampling factor of the USFFT. Factors smaller than the default
+        of 2 use less memory and smaller FFTs but wider interpolation kernels.
+        See :py:class:`USFFTPlan`.
+    chunk_size : int, optional
+        The number of angles transformed together. Smaller chunks bound the
+        memory used by the unequally-spaced frequencies and projections. All
+        angles at once by default.
+    toeplitz : bool
+        Compute cost and grad from the Toeplitz embedding of the normal
+        operator adj(fwd()), which is a convolution on a (2n)^3 grid. The
+        kernel and adj(data) are computed once; afterwards each gradient
+        costs two 3D FFTs instead of two USFFTs. The cost is then computed
+        from inner products and loses precision when the residual is much
+        smaller than the data.
 
     Parameters
     ----------
@@ -40,14 +81,28 @@ class Lamino(CachedFFT, Operator):
         The complex projection data of the object.
     """
 
-    def __init__(self, n, theta, tilt, eps=1e-3,
-                 **kwargs):  # noqa: D102 yapf: disable
+    def __init__(self, n, theta, tilt, eps=1e-3, cache_dir=None,
+                 precompute=False, chunk_size=None, toeplitz=False,
+                 oversample=2, **kwargs):  # noqa: D102 yapf: disable
         """Please see help(Lamino) for more info."""
         self.n = n
         self.ntheta = len(theta)
         self.tilt = tilt
         self.eps = eps
-        self.xi = self._make_grids(theta)
+        self.xi = _get_grids(self.xp, n, theta, tilt, cache_dir)
+        self.precompute = precompute
+        self.interpolation = {}
+        self.chunk_size = chunk_size
+        self.plan = USFFTPlan(n, eps, self.xp, fftn=self._fftn,
+                              oversample=oversample)
+        # checkerboard signs before and after the 2D FFTs of projections
+        self.mask = checkerboard_mask(self.xp, (1, n, n), axes=(1, 2))
+        self.mask_inverse = checkerboard_mask(self.xp, (1, n, n),
+                                              axes=(1, 2),
+                                              inverse=True)
+        self.toeplitz = toeplitz
+        self.toeplitz_kernel = None
+        self.adj_data = None
 
     def __enter__(self):
         """Return self at start of a with-block."""
@@ -58,68 +113,179 @@ class Lamino(CachedFFT, Operator):
         self.gather_kernel = cp.RawKernel(_cu_source, "gather")
         return self
 
-    def fwd(self, u, **kwargs):
-        """Perform the forward Laminography transform."""
+    def __exit__(self, type, value, traceback):
+        """Gracefully handle interruptions or with-block exit."""
+        self.interpolation.clear()
+        self.toeplitz_kernel = None
+        self.adj_data = None
+        CachedFFT.__exit__(self, type, value, traceback)
+
+    def fwd(self, u, out=None, **kwargs):
+        """Perform the forward Laminography transform.
+
+        Parameters
+        ----------
+        out : (ntheta, n, n) complex64, optional
+            An array to hold the result. May be a memory-mapped array on the
+            host, in which case each chunk of angles is copied to it as soon
+            as it is computed.
+        """
+        if out is None:
+            out = self.xp.empty((self.ntheta, self.n, self.n),
+                                dtype='complex64')
+        for lo, hi, data in self._fwd_chunks(u):
+            out[lo:hi] = data if isinstance(out, cp.ndarray) else cp.asnumpy(
+                data)
+        return out
+
+    def adj(self, data, overwrite=False, **kwargs):
+        """Perform the adjoint Laminography transform.
 
-        def gather(xp, Fe, x, n, m, mu):
-            return self.gather(Fe, x, n, m, mu)
+        Parameters
+        ----------
+        data : (ntheta, n, n) complex64
+            May be a memory-mapped array on the host, in which case only one
+            chunk of angles is copied to the device at a time.
+        """
+        return self._adj_chunks(
+            (lo, hi, cp.array(data[lo:hi], dtype='complex64',
+                              copy=not overwrite))
+            for lo, hi in self._chunks())
 
-        def fftn(*args, **kwargs):
-            return self._fftn(*args, overwrite=True, **kwargs)
+    def _chunks(self):
+        """Yield the bounds of each chunk of angles."""
+        step = self.ntheta if self.chunk_size is None else self.chunk_size
+        for lo in range(0, self.ntheta, step):
+            yield lo, min(lo + step, self.ntheta)
 
+    def _fwd_chunks(self, u):
+        """Yield the projections of u one chunk of angles at a time."""
+        half, mu, m = self.plan.half, self.plan.mu, self.plan.m
         # USFFT from equally-spaced grid to unequally-spaced grid
-        F = eq2us(u, self.xi, self.n, self.eps, self.xp, gather,
-                  fftn).reshape([self.ntheta, self.n, self.n])
-
-        # Inverse 2D FFT
-        data = checkerboard(
-            self.xp,
-            self._ifft2(
-                checkerboard(
-                    self.xp,
-                    F,
-                    axes=(1, 2),
-                ),
-                axes=(1, 2),
-                overwrite=True,
-            ),
-            axes=(1, 2),
-            inverse=True,
-        )
-        return data
+        Fe = self.plan.eq2grid(self.asarray(u, dtype='complex64'))
+        for lo, hi in self._chunks():
+            x = self.xi[lo * self.n**2:hi * self.n**2]
+            if self.precompute:
+                F = sparse_gather(self.xp, Fe, x, half, m, mu,
+                                  self._get_interpolation(+1, lo, hi))
+            else:
+                F = self.gather(Fe, x, half, m, mu)
+            F = F.reshape([hi - lo, self.n, self.n])
 
-    def adj(self, data, overwrite=False, **kwargs):
-        """Perform the adjoint Laminography transform."""
-
-        def scatter(xp, f, x, n, m, mu):
-            return self.scatter(f, x, n, m, mu)
-
-        def fftn(*args, **kwargs):
-            return self._fftn(*args, overwrite=True, **kwargs)
-
-        # Forward 2D FFT
-        F = checkerboard(
-            self.xp,
-            self._fft2(
-                checkerboard(
-                    self.xp,
-                    data.copy() if not overwrite else data,
-                    axes=(1, 2),
-                ),
-                axes=(1, 2),
-                overwrite=True,
-            ),
-            axes=(1, 2),
-            inverse=True,
-        ).ravel()
-        # Inverse (x->-x) USFFT from unequally-spaced grid to equally-spaced
-        # grid
-        u = us2eq(F, -self.xi, self.n, self.eps, self.xp, scatter, fftn)
+            # Inverse 2D FFT
+            F *= self.mask
+            data = self._ifft2(F, axes=(1, 2), overwrite=True)
+            data *= self.mask_inverse
+            yield lo, hi, data
+
+    def _adj_chunks(self, chunks):
+        """Return the adjoint of projections given one chunk at a time.
+
+        The chunks may be overwritten.
+        """
+
+        def fft2(chunks):
+            for lo, hi, data in chunks:
+                # Forward 2D FFT
+                data *= self.mask
+                F = self._fft2(data, axes=(1, 2), overwrite=True)
+                F *= self.mask_inverse
+                yield lo, hi, F.ravel()
+
+        return self._scatter_chunks(fft2(chunks))
+
+    def _scatter_chunks(self, chunks):
+        """Return the adjoint USFFT of frequencies given one chunk at a time.
+
+        The chunks are scattered to the same oversampled grid, so only one
+        chunk of frequencies is ever on the device.
+        """
+        half, mu, m = self.plan.half, self.plan.mu, self.plan.m
+        G = self.xp.zeros([2 * half] * 3, dtype="complex64")
+        for lo, hi, F in chunks:
+            # Inverse (x->-x) USFFT from unequally-spaced grid to
+            # equally-spaced grid
+            x = -self.xi[lo * self.n**2:hi * self.n**2]
+            if self.precompute:
+                G += sparse_scatter(self.xp, F, x, half, m, mu,
+                                    self._get_interpolation(-1, lo, hi))
+            else:
+                self.scatter(F, x, half, m, mu, G=G)
+        u = self.plan.grid2eq(G)
         u /= self.n**2
         return u
 
-    def scatter(self, f, x, n, m, mu):
-        G = cp.zeros([2 * n] * 3, dtype="complex64")
+    def _get_toeplitz_kernel(self):
+        """Return the FFT of the circulant kernel of the normal operator.
+
+        adj(fwd(u)) is a convolution of u with K(d) = Σ_ξ exp(2πi d·ξ) / n²
+        for offsets d in [-n, n)^3. One adjoint USFFT of the weights
+        exp(2πi s·ξ) evaluates K on the n^3 offsets d = x + s, so the eight
+        shifts s in {-n/2, n/2}^3 fill the (2n)^3 circulant embedding of K.
+        """
+        if self.toeplitz_kernel is None:
+            n = self.n
+            K = self.xp.empty([2 * n] * 3, dtype='complex64')
+            g = self.xp.arange(-n // 2, n // 2)
+            for s in itertools.product((-n // 2, n // 2), repeat=3):
+                s = self.xp.asarray(s, dtype='float32')
+                k = self._scatter_chunks((
+                    lo,
+                    hi,
+                    self.xp.exp(2j * np.pi * (
+                        self.xi[lo * n**2:hi * n**2] @ s)).astype('complex64'),
+                ) for lo, hi in self._chunks())
+                K[self.xp.ix_(*[(g + int(si)) % (2 * n) for si in s])] = k
+            self.toeplitz_kernel = self._fftn(K, overwrite=True)
+        return self.toeplitz_kernel
+
+    def _normal(self, u):
+        """Return adj(fwd(u)) using the Toeplitz embedding of the kernel."""
+        n = self.n
+        kernel = self._get_toeplitz_kernel()
+        pad = self.xp.zeros([2 * n] * 3, dtype='complex64')
+        pad[:n, :n, :n] = u
+        pad = self._fftn(pad, overwrite=True)
+        pad *= kernel
+        return self._ifftn(pad, overwrite=True)[:n, :n, :n]
+
+    def _get_adj_data(self, data):
+        """Return adj(data) and the squared norm of data; cached by data."""
+        if self.adj_data is None or self.adj_data[0] is not data:
+            norm = 0
+            for lo, hi in self._chunks():
+                norm += self.xp.linalg.norm(self.asarray(data[lo:hi]))**2
+            self.adj_data = (data, self.adj(data), norm)
+        return self.adj_data[1:]
+
+    def _get_interpolation(self, sign, lo, hi):
+        """Return the interpolation matrix for a chunk; build it once."""
+        key = (sign, lo, hi)
+        if key not in self.interpolation:
+            half, mu, m = self.plan.half, self.plan.mu, self.plan.m
+            x = sign * self.xi[lo * self.n**2:hi * self.n**2]
+            nbytes = interpolation_nbytes(len(x), m)
+            free, _ = cp.cuda.Device().mem_info
+            logger.info(
+                "Precomputing a USFFT interpolation matrix of %.3g GB.",
+                nbytes / 1e9)
+            if nbytes > free:
+                warnings.warn(
+                    f"The USFFT interpolation matrix requires {nbytes:,d} "
+                    f"bytes, but only {free:,d} bytes are free.")
+            self.interpolation[key] = interpolation_matrix(
+                cp,
+                x,
+                half,
+                m,
+                mu,
+                sparse=cupyx.scipy.sparse,
+            )
+        return self.interpolation[key]
+
+    def scatter(self, f, x, n, m, mu, G=None):
+        if G is None:
+            G = cp.zeros([2 * n] * 3, dtype="complex64")
         const = cp.array([cp.sqrt(cp.pi / mu)**3, -cp.pi**2 / mu],
                          dtype='float32')
         block = (min(self.scatter_kernel.max_threads_per_block, (2 * m)**3),)
@@ -154,28 +320,80 @@ class Lamino(CachedFFT, Operator):
 
     def cost(self, data, obj):
         "Cost function for the least-squres laminography problem"
-        return self.xp.linalg.norm((self.fwd(obj) - data).ravel())**2
+        if self.toeplitz:
+            # ||Au - d||² = <u, A*Au> - 2 Re<u, A*d> + ||d||²
+            adj_data, norm = self._get_adj_data(data)
+            return (self.xp.vdot(obj, self._normal(obj)).real -
+                    2 * self.xp.vdot(obj, adj_data).real + norm)
+        cost = 0
+        for lo, hi, model in self._fwd_chunks(obj):
+            cost += self.xp.linalg.norm(
+                (model - self.asarray(data[lo:hi])).ravel())**2
+        return cost
 
     def grad(self, data, obj):
         "Gradient for the least-squares laminography problem"
-        return self.adj(data=self.fwd(obj) - data) / (self.ntheta * self.n**3)
-
-    def _make_grids(self, theta):
-        """Return (ntheta*n*n, 3) unequally-spaced frequencies for the USFFT."""
-        [kv, ku] = self.xp.mgrid[-self.n // 2:self.n // 2,
-                                 -self.n // 2:self.n // 2] / self.n
-        ku = ku.ravel().astype('float32')
-        kv = kv.ravel().astype('float32')
-        xi = self.xp.zeros([self.ntheta, self.n * self.n, 3], dtype='float32')
-        ctilt, stilt = self.xp.cos(self.tilt), self.xp.sin(self.tilt)
-        for itheta in range(self.ntheta):
-            ctheta = self.xp.cos(theta[itheta])
-            stheta = self.xp.sin(theta[itheta])
-            xi[itheta, :, 2] = ku * ctheta + kv * stheta * ctilt
-            xi[itheta, :, 1] = -ku * stheta + kv * ctheta * ctilt
-            xi[itheta, :, 0] = kv * stilt
-        # make sure coordinates are in (-0.5,0.5), probably unnecessary
-        xi[xi >= 0.5] = 0.5 - 1e-5
-        xi[xi < -0.5] = -0.5 + 1e-5
-
-        return xi.reshape(self.ntheta * self.n * self.n, 3)
+        if self.toeplitz:
+            adj_data, _ = self._get_adj_data(data)
+            return (self._normal(obj) - adj_data) / (self.ntheta * self.n**3)
+        grad = self._adj_chunks(
+            (lo, hi, model - self.asarray(data[lo:hi]))
+            for lo, hi, model in self._fwd_chunks(obj))
+        return grad / (self.ntheta * self.n**3)
+
+
+def _make_grids(xp, n, theta, tilt):
+    """Return (ntheta*n*n, 3) unequally-spaced frequencies for the USFFT."""
+    [kv, ku] = xp.mgrid[-n // 2:n // 2, -n // 2:n // 2] / n
+    ku = ku.ravel().astype('float32')
+    kv = kv.ravel().astype('float32')
+    theta = xp.asarray(theta)
+    ctheta = xp.cos(theta).astype('float32')[:, None]
+    stheta = xp.sin(theta).astype('float32')[:, None]
+    ctilt = np.float32(np.cos(tilt))
+    stilt = np.float32(np.sin(tilt))
+    xi = xp.empty([len(theta), n * n, 3], dtype='float32')
+    xi[..., 2] = ku * ctheta + kv * stheta * ctilt
+    xi[..., 1] = -ku * stheta + kv * ctheta * ctilt
+    xi[..., 0] = kv * stilt
+    # make sure coordinates are in (-0.5,0.5), probably unnecessary
+    xi[xi >= 0.5] = 0.5 - 1e-5
+    xi[xi < -0.5] = -0.5 + 1e-5
+    return xi.reshape(len(theta) * n * n, 3)
+
+
+def _get_grids(xp, n, theta, tilt, cache_dir=None):
+    """Return the frequency grid for this geometry from a cache if possible.
+
+    Grids are shared between all Lamino operators in this process with the
+    same (n, theta, tilt) on the same device, so they must not be modified
+    in-place. If `cache_dir` is provided, grids are also saved to and loaded
+    from that directory.
+    """
+    theta = cp.asnumpy(theta)
+    digest = hashlib.sha1(theta.tobytes())
+    digest.update(str(theta.dtype).encode())
+    digest.update(np.float64(tilt).tobytes())
+    name = f'lamino-grid-{n}-{digest.hexdigest()}.npy'
+    key = (cp.cuda.runtime.getDevice(), name)
+
+    with _grid_cache_lock:
+        if key in _grid_cache:
+            _grid_cache.move_to_end(key)
+            return _grid_cache[key]
+
+    path = None if cache_dir is None else os.path.join(cache_dir, name)
+    if path is not None and os.path.isfile(path):
+        logger.info("Loading the frequency grid from %s.", path)
+        xi = xp.asarray(np.load(path))
+    else:
+        xi = _make_grids(xp, n, theta, tilt)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(path, cp.asnumpy(xi))
+
+    with _grid_cache_lock:
+        _grid_cache[key] = xi
+        while len(_grid_cache) > _grid_cache_size:
+            _grid_cache.popitem(last=False)
+    return xi
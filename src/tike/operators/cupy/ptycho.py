@@ -45,14 +45,15 @@ class Ptycho(Operator):
     psi : (ntheta, nz, n) complex64
         The complex wavefront modulation of the object.
     probe : complex64
-        The complex (ntheta, nscan // fly, fly, 1, probe_shape,
+        The complex (ntheta, nscan // fly, fly, nmode, probe_shape,
         probe_shape) illumination function.
     mode : complex64
         A single (ntheta, nscan // fly, fly, 1, probe_shape, probe_shape)
         probe mode.
     nearplane, farplane: complex64
-        The (ntheta, nscan // fly, fly, 1, detector_shape, detector_shape)
-        wavefronts exiting the object and hitting the detector respectively.
+        The (ntheta, nscan // fly, fly, nmode, detector_shape,
+        detector_shape) wavefronts exiting the object and hitting the
+        detector respectively. All of the probe modes are propagated at once.
     data : (ntheta, nscan // fly, detector_shape, detector_shape) float32
         The square of the absolute value of `farplane` summed over `fly` and
         `modes`.
@@ -101,12 +102,13 @@ class Ptycho(Operator):
         self.propagation.__exit__(type, value, traceback)
         self.diffraction.__exit__(type, value, traceback)
 
-    def fwd(self, probe, scan, psi, **kwargs):
+    def fwd(self, probe, scan, psi, cache=True, **kwargs):
         return self.propagation.fwd(
             self.diffraction.fwd(
                 psi=psi,
                 scan=scan,
                 probe=probe,
+                cache=cache,
             ),
             overwrite=True,
         )
@@ -135,38 +137,35 @@ class Ptycho(Operator):
 
     def _compute_intensity(self, data, psi, scan, probe, n=-1, mode=None):
         """Compute detector intensities replacing the nth probe mode"""
-        intensity = 0
-        for m in range(probe.shape[-3]):
-            intensity += np.sum(
-                np.square(np.abs(self.fwd(
-                    psi=psi,
-                    scan=scan,
-                    probe=mode if m == n else probe[..., m:m + 1, :, :],
-                ).reshape(*data.shape[:2], -1, *data.shape[2:]))),
-                axis=2,
-            )  # yapf: disable
-        return intensity
+        if mode is not None and 0 <= n < probe.shape[-3]:
+            probe = self.xp.concatenate(
+                (probe[..., :n, :, :], mode, probe[..., n + 1:, :, :]),
+                axis=-3,
+            )
+        return self._sum_intensity(self.fwd(psi=psi, scan=scan, probe=probe),
+                                   data.shape)
+
+    def _sum_intensity(self, farplane, shape):
+        """Sum the intensity of farplane over fly positions and modes."""
+        return np.sum(
+            np.square(np.abs(farplane)).reshape(*shape[:2], -1, *shape[2:]),
+            axis=2,
+        )
 
     def cost(self, data, psi, scan, probe, n=-1, mode=None) -> float:
         intensity = self._compute_intensity(data, psi, scan, probe, n, mode)
         return self.propagation.cost(data, intensity)
 
     def grad(self, data, psi, scan, probe):
-        intensity = self._compute_intensity(data, psi, scan, probe)
-        grad_obj = self.xp.zeros_like(psi)
-        for mode in np.split(probe, probe.shape[-3], axis=-3):
-            # TODO: Pass obj through adj() instead of making new obj inside
-            grad_obj += self.adj(
-                farplane=self.propagation.grad(
-                    data,
-                    self.fwd(psi=psi, scan=scan, probe=mode),
-                    intensity,
-                ),
-                probe=mode,
-                scan=scan,
-                overwrite=True,
-            )
-        return grad_obj
+        farplane = self.fwd(psi=psi, scan=scan, probe=probe)
+        intensity = self._sum_intensity(farplane, data.shape)
+        # TODO: Pass obj through adj() instead of making new obj inside
+        return self.adj(
+            farplane=self.propagation.grad(data, farplane, intensity),
+            probe=probe,
+            scan=scan,
+            overwrite=True,
+        )
 
     def grad_probe(self, data, psi, scan, probe, n=-1, mode=None):
         intensity = self._compute_intensity(data, psi, scan, probe, n, mode)
@@ -6,7 +6,42 @@ from .operator import Operator
 
 
 class Shift(CachedFFT, Operator):
-    """Shift last two dimensions of an array using Fourier method."""
+    """Shift last two dimensions of an array using Fourier method.
+
+    Real-valued arrays are shifted with real FFTs and stay real.
+
+    Attributes
+    ----------
+    padding : float
+        The fraction of the height and width added as zeros to both sides of
+        the images before shifting, so that content shifted out of the field
+        of view does not wrap around to the other side. The default of 0.5
+        doubles both dimensions; 0 shifts circularly without padding.
+    """
+
+    def __init__(self, padding=0.5):
+        """Please see help(Shift) for more info."""
+        self.padding = padding
+        self.freq_cache = {}
+
+    def __exit__(self, type, value, traceback):
+        """Gracefully handle interruptions or with-block exit."""
+        self.freq_cache.clear()
+        CachedFFT.__exit__(self, type, value, traceback)
+
+    def _get_frequencies(self, shape, real=False):
+        """Return the 1D frequencies of the last two dimensions of shape.
+
+        The frequencies are cached and broadcast as (H, 1) and (W, ).
+        """
+        key = (*shape, real)
+        if key not in self.freq_cache:
+            fftfreq = self.xp.fft.rfftfreq if real else self.xp.fft.fftfreq
+            self.freq_cache[key] = (
+                self.xp.fft.fftfreq(shape[0]).astype('float32')[:, None],
+                fftfreq(shape[1]).astype('float32'),
+            )
+        return self.freq_cache[key]
 
     def fwd(self, a, shift, overwrite=False):
         """Apply shifts along last two dimensions of a.
@@ -21,16 +56,39 @@ class Shift(CachedFFT, Operator):
         """
         shape = a.shape
         a = a.reshape(-1, *shape[-2:])
-        pz, pn = a.shape[-2] // 2, a.shape[-1] // 2
-        padded = self.xp.pad(a, ((0, 0), (pz, pz), (pn, pn)))
-        [x, y] = self.xp.meshgrid(
-            self.xp.fft.fftfreq(2 * pn + a.shape[-1]).astype('float32'),
-            self.xp.fft.fftfreq(2 * pz + a.shape[-2]).astype('float32'),
-        )
-        shift = self.xp.exp(
-            -2j * self.xp.pi *
-            (x * shift[..., 1, None, None] + y * shift[..., 0, None, None]))
-        padded = self._fft2(padded, axes=(-2, -1), overwrite=overwrite)
-        padded *= shift
-        padded = self._ifft2(padded, axes=(-2, -1), overwrite=overwrite)
-        return padded[..., pz:-pz, pn:-pn].reshape(shape)
+        shift = shift.reshape(-1, 2)
+        pz = int(self.padding * shape[-2])
+        pn = int(self.padding * shape[-1])
+        if pz > 0 or pn > 0:
+            a = self.xp.pad(a, ((0, 0), (pz, pz), (pn, pn)))
+            overwrite = True
+        real = not self.xp.iscomplexobj(a)
+        y, x = self._get_frequencies(a.shape[-2:], real)
+        if real:
+            padded = self._rfft2(a, axes=(-2, -1))
+        else:
+            padded = self._fft2(a, axes=(-2, -1), overwrite=overwrite)
+        # The phase ramp is separable, so apply it as two 1D ramps.
+        ramp_y = self.xp.exp(-2j * self.xp.pi * y * shift[:, 0, None, None])
+        ramp_x = self.xp.exp(-2j * self.xp.pi * x * shift[:, 1, None, None])
+        ny, nx = a.shape[-2:]
+        if real:
+            # The real part of the complex shift has a Hermitian spectrum: the
+            # ramps are real at the Nyquist frequencies, and the shared
+            # Nyquist corner is scaled by cos(π (sy + sx)).
+            if ny % 2 == 0 and nx % 2 == 0:
+                corner = padded[:, ny // 2, -1] * self.xp.cos(
+                    self.xp.pi * (shift[:, 0] + shift[:, 1]))
+            if ny % 2 == 0:
+                ramp_y[:, ny // 2] = ramp_y[:, ny // 2].real
+            if nx % 2 == 0:
+                ramp_x[..., -1] = ramp_x[..., -1].real
+        padded *= ramp_y
+        padded *= ramp_x
+        if real and ny % 2 == 0 and nx % 2 == 0:
+            padded[:, ny // 2, -1] = corner
+        if real:
+            padded = self._irfft2(padded, s=a.shape[-2:], axes=(-2, -1))
+        else:
+            padded = self._ifft2(padded, axes=(-2, -1), overwrite=True)
+        return padded[..., pz:pz + shape[-2], pn:pn + shape[-1]].reshape(shape)
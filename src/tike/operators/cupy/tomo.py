@@ -0,0 +1,140 @@
+__author__ = "Daniel Ching, Viktor Nikitin"
+__copyright__ = "Copyright (c) 2020, UChicago Argonne, LLC."
+
+import numpy as np
+
+from .operator import Operator
+from .usfft import (USFFTPlan, binned_gather, binned_scatter,
+                    checkerboard_mask, interpolation_matrix)
+
+
+class Tomo(Operator):
+    """A parallel-beam tomography operator based on the Fourier slice theorem.
+
+    The 1D Fourier transform of a projection is a line through the 2D Fourier
+    transform of each slice of the object, so projections are computed with
+    the 2D USFFT. This operator uses NumPy and runs on the CPU.
+
+    Attributes
+    ----------
+    n : int
+        The pixel width of the object slices and the projections.
+    theta : (ntheta, ) float32
+        The projection angles; rotation around the vertical axis of the object.
+        At zero, the object is integrated along its middle axis.
+    eps : float
+        The desired relative accuracy of the USFFT.
+    oversample : float
+        The oversampling factor of the USFFT. See :py:class:`USFFTPlan`.
+    precompute : bool
+        Build the USFFT interpolation as sparse matrices the first time they
+        are needed and apply them to all slices at once. Much faster for
+        iterative methods, but the matrices need (2m)^2 * 8 bytes per
+        frequency.
+
+    Parameters
+    ----------
+    obj : (nz, n, n) complex64
+        The complex object to be transformed or recovered. nz is the axis
+        corresponding to the rotation axis.
+    data : (ntheta, nz, n) complex64
+        The radon transform of `obj`.
+    """
+
+    xp = np
+
+    @classmethod
+    def asarray(cls, *args, device=None, **kwargs):
+        return np.asarray(*args, **kwargs)
+
+    @classmethod
+    def asnumpy(cls, *args, **kwargs):
+        return np.asarray(*args, **kwargs)
+
+    def __init__(self, n, theta, eps=1e-3, oversample=2, precompute=False,
+                 **kwargs):  # noqa: D102 yapf: disable
+        """Please see help(Tomo) for more info."""
+        self.n = n
+        self.theta = np.asarray(theta, dtype='float32')
+        self.ntheta = len(self.theta)
+        self.eps = eps
+        self.precompute = precompute
+        self.interpolation = {}
+        self.plan = USFFTPlan(n, eps, np, ndim=2, oversample=oversample)
+        # The frequencies of each projection along a line through the origin
+        k = np.arange(-n // 2, n // 2, dtype='float32') / n
+        self.xi = np.stack(
+            [
+                np.outer(np.sin(self.theta), k),
+                np.outer(np.cos(self.theta), k),
+            ],
+            axis=-1,
+        ).reshape(self.ntheta * n, 2)
+        # checkerboard signs before and after the 1D FFTs of projections
+        self.mask = checkerboard_mask(np, (1, 1, n), axes=(2,))
+        self.mask_inverse = checkerboard_mask(np, (1, 1, n),
+                                              axes=(2,),
+                                              inverse=True)
+
+    def __exit__(self, type, value, traceback):
+        """Gracefully handle interruptions or with-block exit."""
+        self.interpolation.clear()
+
+    def fwd(self, obj, **kwargs):
+        """Perform the forward Radon transform."""
+        half, mu, m = self.plan.half, self.plan.mu, self.plan.m
+        # USFFT from equally-spaced grid to unequally-spaced grid
+        Fe = self.plan.eq2grid(np.asarray(obj, dtype='complex64'))
+        if self.precompute:
+            matrix = self._get_interpolation(+1)
+            Fe = Fe.reshape(len(Fe), -1).T
+            F = (matrix @ Fe.real + 1j * (matrix @ Fe.imag)).T
+        else:
+            F = binned_gather(np, Fe, self.xi, half, m, mu)
+        F = F.reshape(len(F), self.ntheta, self.n).swapaxes(0, 1)
+
+        # Inverse 1D FFT
+        data = np.fft.ifft(F * self.mask, axis=-1)
+        data *= self.mask_inverse
+        return data.astype('complex64', copy=False)
+
+    def adj(self, data, **kwargs):
+        """Perform the adjoint Radon transform."""
+        half, mu, m = self.plan.half, self.plan.mu, self.plan.m
+        # Forward 1D FFT
+        F = np.fft.fft(np.asarray(data, dtype='complex64') * self.mask,
+                       axis=-1)
+        F *= self.mask_inverse
+        F = F.swapaxes(0, 1).reshape(F.shape[1], self.ntheta * self.n)
+
+        # Inverse (x->-x) USFFT from unequally-spaced grid to equally-spaced
+        # grid
+        if self.precompute:
+            matrix = self._get_interpolation(-1).T
+            G = (matrix @ F.real.T + 1j * (matrix @ F.imag.T)).T
+            G = G.astype('complex64').reshape(len(F), *[2 * half] * 2)
+        else:
+            G = binned_scatter(np, F, -self.xi, half, m, mu)
+        u = self.plan.grid2eq(G)
+        u /= self.n
+        return u.astype('complex64', copy=False)
+
+    def cost(self, data, obj):
+        "Cost function for the least-squres tomography problem"
+        return np.linalg.norm((self.fwd(obj) - data).ravel())**2
+
+    def grad(self, data, obj):
+        "Gradient for the least-squares tomography problem"
+        return self.adj(data=self.fwd(obj) - data) / (self.ntheta * self.n)
+
+    def _get_interpolation(self, sign):
+        """Return the interpolation matrix for sign * xi; build it once."""
+        if sign not in self.interpolation:
+            self.interpolation[sign] = interpolation_matrix(
+                np,
+                sign * self.xi,
+                self.plan.half,
+                self.plan.m,
+                self.plan.mu,
+            )
+        return self.interpolation[sign]
@@ -5,18 +5,35 @@ a non-uniform domain or vice-versa. This module provides forward Fourier
 transforms for those two cased. The inverser Fourier transforms may be created
 by negating the frequencies on the non-uniform grid.
 """
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
 import numpy as np
 
 
-def _get_kernel(xp, pad, mu):
-    """Return the interpolation kernel for the USFFT."""
-    xeq = xp.mgrid[-pad:pad, -pad:pad, -pad:pad]
-    return xp.exp(-mu * xp.sum(xeq**2, axis=0)).astype('float32')
+def _get_params(n, eps, oversample=2):
+    """Return the kernel parameters (mu, m) of the USFFT.
+
+    mu is the width of the Gaussian spreading kernel, and the kernel is
+    truncated to 2m grid points along each dimension. mu is chosen so that the
+    aliases of the deconvolution kernel from the oversampled grid of width N
+    are suppressed by eps, exp(-mu N (N - n)) = eps, so smaller oversampling
+    factors need wider kernels.
+    """
+    N = _get_size(n, oversample)
+    mu = -np.log(eps) / (N * (N - n))
+    Te = 1 / np.pi * np.sqrt(-mu * np.log(eps) + (mu * n)**2 / 4)
+    m = int(np.ceil(N * Te))
+    return mu, m
+
 
-def _get_kernel2d(xp, pad, mu):
-    """Return the interpolation kernel for the 2d USFFT."""
-    xeq = xp.mgrid[-pad:pad, -pad:pad]
-    return xp.exp(-mu * xp.sum(xeq**2, axis=0)).astype('float32')
+def _get_size(n, oversample=2):
+    """Return the width of the oversampled grid: an even number > n."""
+    if oversample <= 1:
+        raise ValueError(
+            f"The oversampling factor must be > 1, not {oversample}.")
+    return max(2 * int(np.ceil(oversample * n / 2)), n + 2)
 
 
 def vector_gather(xp, Fe, x, n, m, mu):
@@ -93,7 +110,274 @@ def sequential_gather(xp, Fe, x, n, m, mu):
     return F
 
 
-def eq2us(f, x, n, eps, xp, gather=vector_gather, fftn=None):
+def _separable_kernel(xp, x, n, m, mu):
+    """Return the grid indices and 1D kernel weights along each dimension.
+
+    The Gaussian spreading kernel is separable, so instead of evaluating it at
+    all (2m)^ndim grid points around each non-uniform frequency, it is
+    evaluated as ndim vectors of 2m weights whose outer product is the kernel.
+
+    Parameters
+    ----------
+    x : (N, ndim) float32
+        The non-uniform frequencies.
+
+    Returns
+    -------
+    ids : (N, ndim, 2m) int32
+        Indices of the equally-spaced (2n)^ndim grid covered by the kernel.
+    weights : (N, ndim, 2m) float32
+        The kernel weights along each dimension.
+    """
+    ndim = x.shape[-1]
+    cons = [np.sqrt(np.pi / mu)**ndim, -np.pi**2 / mu]
+    ell = ((2 * n * x) // 1).astype(xp.int32)  # nearest grid to x
+    grid = ell[..., None] + xp.arange(-m, m, dtype=xp.int32)
+    delta = (grid.astype('float32') / (2 * n) - x[..., None])**2
+    weights = xp.exp(cons[1] * delta).astype('float32')
+    weights[:, 0] *= cons[0]
+    return (n + grid) % (2 * n), weights
+
+
+def _outer(xp, weights):
+    """Return the (N, 2m, ..., 2m) outer product of (N, ndim, 2m) weights."""
+    ndim = weights.shape[1]
+    kernel = weights[:, 0]
+    for dim in range(1, ndim):
+        kernel = kernel[..., None] * weights[:, dim].reshape(
+            -1, *([1] * dim), weights.shape[-1])
+    return kernel
+
+
+def _sort_into_bins(xp, ids, bin_size, n):
+    """Return bin labels and the order that sorts the frequencies into bins.
+
+    Each bin is a cube of `bin_size` grid points on the (2n)^ndim grid. The
+    lower corner of each kernel i.e. ids[:, :, 0] decides the bin.
+    """
+    nbins = -(-2 * n // bin_size)
+    label = xp.zeros(ids.shape[0], dtype=xp.int64)
+    for dim in range(ids.shape[1]):
+        label = label * nbins + ids[:, dim, 0] // bin_size
+    order = xp.argsort(label, kind='stable')
+    return label[order], order
+
+
+def binned_gather(xp, Fe, x, n, m, mu, chunk=None, num_threads=None):
+    """A multithreaded CPU implementation of sequential_gather.
+
+    The non-uniform frequencies are sorted so that neighboring frequencies
+    read from neighboring regions of Fe, and then interpolated in chunks
+    which fit in cache. The kernel is computed as ndim 1D weight vectors.
+    This function is a drop-in replacement for vector_gather which also
+    accepts a stack of grids; the kernel is computed once for all of them.
+
+    Parameters
+    ----------
+    Fe : (..., 2n, ..., 2n) complex64
+        A stack of equally-spaced grids.
+    chunk : int
+        The number of frequencies interpolated together by each thread.
+    num_threads : int
+        The number of threads to use. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    F : (..., N) complex64
+        The values at the non-uniform frequencies for each grid.
+    """
+    ndim = x.shape[-1]
+    stack = Fe.shape[:-ndim]
+    Fe = Fe.reshape(-1, (2 * n)**ndim)
+    if chunk is None:
+        chunk = max(1, 2**18 // (2 * m)**ndim // len(Fe))
+    stride = (2 * n)**xp.arange(ndim - 1, -1, -1)
+    ids, weights = _separable_kernel(xp, x, n, m, mu)
+    _, order = _sort_into_bins(xp, ids, 2 * m, n)
+    F = xp.empty((len(Fe), x.shape[0]), dtype="complex64")
+
+    def interpolate(lo):
+        points = order[lo:lo + chunk]
+        index = ids[points, 0] * stride[0]
+        for dim in range(1, ndim):
+            index = index[..., None] + (ids[points, dim] * stride[dim]).reshape(
+                -1, *([1] * dim), 2 * m)
+        block = Fe[:, index]
+        for dim in range(ndim - 1, -1, -1):
+            block = xp.einsum('sn...k,nk->sn...', block, weights[points, dim])
+        F[:, points] = block
+
+    with ThreadPoolExecutor(num_threads or os.cpu_count()) as pool:
+        list(pool.map(interpolate, range(0, x.shape[0], chunk)))
+    return F.reshape(*stack, x.shape[0])
+
+
+def binned_scatter(xp, f, x, n, m, mu, bin_size=None, num_threads=None):
+    """A multithreaded CPU implementation of sequential_scatter.
+
+    The non-uniform frequencies are sorted into bins of `bin_size` grid
+    points. Each bin is spread onto a small private subgrid which covers the
+    bin and its kernel halo, then the subgrid is added to the full grid. Bins
+    are processed concurrently by `num_threads` threads. The kernel is
+    computed as ndim 1D weight vectors. This function is a drop-in replacement
+    for vector_scatter which also accepts a stack of values; the kernel is
+    computed once for all of them.
+
+    Parameters
+    ----------
+    f : (..., N) complex64
+        A stack of values at the non-uniform frequencies.
+    bin_size : int
+        The width of the bins in grid points. Defaults to 16 or smaller if the
+        grid is small.
+    num_threads : int
+        The number of threads to use. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    G : (..., 2n, ..., 2n) complex64
+        The equally-spaced grid for each stack of values.
+    """
+    ndim = x.shape[-1]
+    stack = f.shape[:-1]
+    f = f.reshape(-1, x.shape[0])
+    bin_size = 16 if bin_size is None else bin_size
+    bin_size = min(bin_size, 2 * n - 2 * m)
+    if bin_size < 1:
+        # The kernel is wider than the grid, so subgrids would wrap on
+        # themselves.
+        if ndim == 2:
+            G = [vector_scatter2d(xp, f1, x, n, m, mu) for f1 in f]
+        else:
+            G = [vector_scatter(xp, f1, x, n, m, mu, ndim=ndim) for f1 in f]
+        return xp.stack(G).reshape(*stack, *[2 * n] * ndim)
+    width = bin_size + 2 * m  # width of the subgrids
+    stride = width**xp.arange(ndim - 1, -1, -1)
+
+    ids, weights = _separable_kernel(xp, x, n, m, mu)
+    label, order = _sort_into_bins(xp, ids, bin_size, n)
+    bounds = xp.concatenate([
+        xp.zeros(1, dtype=xp.int64),
+        xp.flatnonzero(xp.diff(label)) + 1,
+        xp.full(1, len(label), dtype=xp.int64),
+    ])
+    G = xp.zeros([len(f)] + [2 * n] * ndim, dtype="complex64")
+    size = len(f) * width**ndim  # size of the stack of subgrids
+    lock = threading.Lock()
+
+    def spread(lo, hi):
+        points = order[lo:hi]
+        # The lower corner of the subgrid on the full grid
+        corner = ids[points[0], :, 0] // bin_size * bin_size
+        # Position of each kernel in the subgrid; (ids - corner) wraps
+        local = (ids[points, :, 0] - corner) % (2 * n)
+        index = local[:, 0, None] * stride[0] + xp.arange(2 * m) * stride[0]
+        for dim in range(1, ndim):
+            index = index[..., None] + (
+                (local[:, dim, None] + xp.arange(2 * m)) * stride[dim]
+            ).reshape(-1, *([1] * dim), 2 * m)
+        vals = (f[:, points].reshape(len(f), -1, *([1] * ndim))
+                * _outer(xp, weights[points])).ravel()
+        index = (xp.arange(len(f))[:, None] * width**ndim
+                 + index.reshape(1, -1)).ravel()
+        sub = (
+            xp.bincount(index, weights=vals.real, minlength=size)
+            + 1j * xp.bincount(index, weights=vals.imag, minlength=size)
+        ).reshape([len(f)] + [width] * ndim)
+        rows = xp.ix_(*[(c + xp.arange(width)) % (2 * n) for c in corner])
+        with lock:
+            G[(slice(None), *rows)] += sub
+
+    with ThreadPoolExecutor(num_threads or os.cpu_count()) as pool:
+        list(pool.map(spread, bounds[:-1], bounds[1:]))
+    return G.reshape(*stack, *[2 * n] * ndim)
+
+
+def interpolation_nbytes(nf, m, ndim=3):
+    """Return the number of bytes used by an interpolation_matrix.
+
+    Parameters
+    ----------
+    nf : int
+        The number of non-uniform frequencies.
+    """
+    nnz = nf * (2 * m)**ndim
+    # float32 values and int32 column indices plus the row pointers
+    return nnz * (4 + 4) + (nf + 1) * 4
+
+
+def interpolation_matrix(xp, x, n, m, mu, sparse=None):
+    """Return the gather operation as a sparse matrix.
+
+    The returned (N, (2n)^ndim) CSR matrix, S, maps the equally-spaced grid to
+    the non-uniform frequencies, so S @ Fe.ravel() is a gather and
+    S.T @ f is a scatter. Building the matrix once trades memory for time
+    when the frequencies do not change between transforms; see
+    interpolation_nbytes for the memory requirement.
+
+    Parameters
+    ----------
+    x : (N, ndim) float32
+        The non-uniform frequencies.
+    sparse : module
+        The sparse matrix module matching xp e.g. scipy.sparse.
+
+    Raises
+    ------
+    ValueError
+        If the indices of the matrix do not fit in int32.
+    """
+    if sparse is None:
+        import scipy.sparse as sparse
+    ndim = x.shape[-1]
+    nk = (2 * m)**ndim
+    nnz = x.shape[0] * nk
+    if max(nnz, (2 * n)**ndim) >= 2**31:
+        raise ValueError(
+            f"The interpolation matrix of {nnz} non-zeros is too large to "
+            "precompute.")
+    stride = (2 * n)**xp.arange(ndim - 1, -1, -1)
+    ids, weights = _separable_kernel(xp, x, n, m, mu)
+    index = ids[:, 0] * stride[0]
+    for dim in range(1, ndim):
+        index = index[..., None] + (ids[:, dim] * stride[dim]).reshape(
+            -1, *([1] * dim), 2 * m)
+    return sparse.csr_matrix(
+        (
+            _outer(xp, weights).ravel(),
+            index.ravel().astype(xp.int32),
+            xp.arange(0, nnz + 1, nk, dtype=xp.int32),
+        ),
+        shape=(x.shape[0], (2 * n)**ndim),
+    )
+
+
+def sparse_gather(xp, Fe, x, n, m, mu, matrix=None):
+    """Gather F from the regular grid with an interpolation_matrix.
+
+    The matrix is built from (x, n, m, mu) if it is not provided.
+    """
+    if matrix is None:
+        matrix = interpolation_matrix(xp, x, n, m, mu)
+    Fe = Fe.ravel()
+    # Real and imaginary parts are separate to avoid casting the matrix.
+    F = matrix @ Fe.real + 1j * (matrix @ Fe.imag)
+    return F.astype('complex64')
+
+
+def sparse_scatter(xp, f, x, n, m, mu, matrix=None):
+    """Scatter f to the regular grid with an interpolation_matrix.
+
+    The matrix is built from (x, n, m, mu) if it is not provided.
+    """
+    if matrix is None:
+        matrix = interpolation_matrix(xp, x, n, m, mu)
+    ndim = x.shape[-1]
+    G = matrix.T @ f.real + 1j * (matrix.T @ f.imag)
+    return G.astype('complex64').reshape([2 * n] * ndim)
+
+
+def eq2us(f, x, n, eps, xp, gather=vector_gather, fftn=None, oversample=2):
     """USFFT from equally-spaced grid to unequally-spaced grid.
 
     Parameters
@@ -104,29 +388,25 @@ def eq2us(f, x, n, eps, xp, gather=vector_gather, fftn=None):
         The sampled frequencies on unequally-spaced grid.
     eps : float
         The desired relative accuracy of the USFFT.
+    oversample : float
+        The ratio of the widths of the oversampled and equally-spaced grids.
+        The kernel width is chosen to meet eps for any factor > 1.
     """
-    fftn = xp.fft.fftn if fftn is None else fftn
-    ndim = f.ndim
-    pad = n // 2  # where zero-padding stops
-    end = pad + n  # where f stops
+    return USFFTPlan(n, eps, xp, ndim=f.ndim, fftn=fftn,
+                     oversample=oversample).eq2us(f, x, gather)
 
-    # parameters for the USFFT transform
-    mu = -xp.log(eps) / (2 * n**2)
-    Te = 1 / xp.pi * xp.sqrt(-mu * xp.log(eps) + (mu * n)**2 / 4)
-    m = xp.int(xp.ceil(2 * n * Te))
 
-    # smearing kernel (kernel)
-    kernel = _get_kernel(xp, pad, mu)
+def eq2grid(f, n, eps, xp, fftn=None, oversample=2):
+    """Return the oversampled spectrum of f for gathering.
 
-    # FFT and compesantion for smearing
-    fe = xp.zeros([2 * n] * ndim, dtype="complex64")
-    fe[pad:end, pad:end, pad:end] = f / ((2 * n)**ndim * kernel)
-    Fe = checkerboard(xp, fftn(checkerboard(xp, fe)), inverse=True)
-    F = gather(xp, Fe, x, n, m, mu)
-
-    return F
+    This is the first half of eq2us. The spectrum may be reused to gather
+    from many sets of unequally-spaced frequencies.
+    """
+    return USFFTPlan(n, eps, xp, ndim=f.ndim, fftn=fftn,
+                     oversample=oversample).eq2grid(f)
 
-def eq2us2d(f, x, n, eps, xp, gather=vector_gather2d, fftn=None):
+def eq2us2d(f, x, n, eps, xp, gather=vector_gather2d, fftn=None,
+            oversample=2):
     """2d USFFT from equally-spaced grid to unequally-spaced grid.
 
     Parameters
@@ -138,26 +418,9 @@ def eq2us2d(f, x, n, eps, xp, gather=vector_gather2d, fftn=None):
     eps : float
         The desired relative accuracy of the USFFT.
     """
-    fftn = xp.fft.fftn if fftn is None else fftn
-    ndim = f.ndim
-    pad = n // 2  # where zero-padding stops
-    end = pad + n  # where f stops
+    return USFFTPlan(n, eps, xp, ndim=2, fftn=fftn,
+                     oversample=oversample).eq2us(f, x, gather)
 
-    # parameters for the USFFT transform
-    mu = -xp.log(eps) / (2 * n**2)
-    Te = 1 / xp.pi * xp.sqrt(-mu * xp.log(eps) + (mu * n)**2 / 4)
-    m = xp.int(xp.ceil(2 * n * Te))
-
-    # smearing kernel (kernel)
-    kernel = _get_kernel2d(xp, pad, mu)
-
-    # FFT and compesantion for smearing
-    fe = xp.zeros([2 * n] * ndim, dtype="complex64")
-    fe[pad:end, pad:end] = f / ((2 * n)**ndim * kernel)
-    Fe = checkerboard(xp, fftn(checkerboard(xp, fe)), inverse=True)
-    F = gather(xp, Fe, x, n, m, mu)
-
-    return F
 
 def sequential_scatter(xp, f, x, n, m, mu):
     """Scatter f to the regular grid.
@@ -234,15 +497,15 @@ def vector_scatter2d(xp, f, x, n, m, mu):
 
     G = xp.zeros([(2 * n)**2], dtype="complex64")
     ell = ((2 * n * x) // 1).astype(xp.int32)  # nearest grid to x
-    stride = ((2 * n)**2, 2 * n)
+    stride = 2 * n
     for i0 in range(-m, m):
         delta0 = delta(ell[:, 0], i0, x[:, 0])
         for i1 in range(-m, m):
             delta1 = delta(ell[:, 1], i1, x[:, 1])
             Fkernel = cons[0] * xp.exp(cons[1] * (delta0 + delta1))
             ids = (
-                                ((n + ell[:, 2] + i2) % (2 * n))
-                + stride[1] * ((n + ell[:, 1] + i1) % (2 * n))
+                                ((n + ell[:, 1] + i1) % (2 * n))
+                + stride * ((n + ell[:, 0] + i0) % (2 * n))
             )  # yapf: disable
             vals = f * Fkernel
             # accumulate by indexes (with possible index intersections),
@@ -254,7 +517,8 @@ def vector_scatter2d(xp, f, x, n, m, mu):
     return G.reshape([2 * n] * 2)
 
 
-def us2eq(f, x, n, eps, xp, scatter=vector_scatter, fftn=None):
+def us2eq(f, x, n, eps, xp, scatter=vector_scatter, fftn=None,
+          oversample=2):
     """USFFT from unequally-spaced grid to equally-spaced grid.
 
     Parameters
@@ -269,29 +533,134 @@ def us2eq(f, x, n, eps, xp, scatter=vector_scatter, fftn=None):
         The accuracy of computing USFFT
     scatter : function
         The scatter function to use.
+    oversample : float
+        The ratio of the widths of the oversampled and equally-spaced grids.
+        The kernel width is chosen to meet eps for any factor > 1.
     """
-    fftn = xp.fft.fftn if fftn is None else fftn
-    pad = n // 2  # where zero-padding stops
-    end = pad + n  # where f stops
+    return USFFTPlan(n, eps, xp, ndim=x.shape[-1], fftn=fftn,
+                     oversample=oversample).us2eq(f, x, scatter)
 
-    # parameters for the USFFT transform
-    mu = -xp.log(eps) / (2 * n**2)
-    Te = 1 / xp.pi * xp.sqrt(-mu * xp.log(eps) + (mu * n)**2 / 4)
-    m = xp.int(xp.ceil(2 * n * Te))
 
-    # smearing kernel (ker)
-    kernel = _get_kernel(xp, pad, mu)
+def grid2eq(G, n, eps, xp, fftn=None, oversample=2):
+    """Return the (n, n, n) function from its scattered oversampled spectrum.
 
-    G = scatter(xp, f, x, n, m, mu)
+    This is the second half of us2eq. G may be accumulated by scattering many
+    sets of unequally-spaced frequencies onto the same grid.
+    """
+    return USFFTPlan(n, eps, xp, ndim=G.ndim, fftn=fftn,
+                     oversample=oversample).grid2eq(G)
 
-    # FFT and compesantion for smearing
-    F = checkerboard(xp, fftn(checkerboard(xp, G)), inverse=True)
-    F = F[pad:end, pad:end, pad:end] / ((2 * n)**3 * kernel)
 
-    return F
+class USFFTPlan():
+    """A reusable plan for the USFFT of an equally-spaced (n,) * ndim grid.
+
+    The plan computes the kernel parameters, the deconvolution kernel, and the
+    checkerboard sign masks once and keeps a zero-padded work buffer, so its
+    methods do no setup per call. The checkerboard signs applied before the
+    forward FFT and after the cropping FFT are folded into the deconvolution
+    kernel.
 
+    Attributes
+    ----------
+    n : int
+        The size of the equally-spaced grid.
+    eps : float
+        The desired relative accuracy of the USFFT.
+    oversample : float
+        The ratio of the widths of the oversampled and equally-spaced grids.
+        A factor of 1.5 uses (2 / 1.5)^ndim times less memory for the
+        oversampled grid than the default of 2, but needs a wider kernel.
+        The deconvolution amplifies rounding errors by up to
+        exp(ndim mu n^2 / 4), and mu grows as the factor shrinks, so in
+        single precision and 3D a factor of 1.5 reaches about eps=1e-3 and a
+        factor of 1.25 only about 1e-2.
+    half : int
+        Half the width of the oversampled grid. The gather and scatter
+        functions take it in place of n.
+    mu : float
+        The width of the Gaussian spreading kernel.
+    m : int
+        The half-width of the spreading kernel in grid points.
+
+    Parameters
+    ----------
+    xp : module
+        The array module: numpy or cupy.
+    ndim : int
+        The number of dimensions of the equally-spaced grid.
+    fftn : function
+        The n-dimensional FFT to use. It must not modify its input.
+    """
 
-def us2eq2d(f, x, n, eps, xp, scatter=vector_scatter2d, fftn=None):
+    def __init__(self, n, eps, xp=np, ndim=3, fftn=None, oversample=2):
+        self.n = n
+        self.eps = eps
+        self.xp = xp
+        self.ndim = ndim
+        self.fftn = xp.fft.fftn if fftn is None else fftn
+        self.oversample = oversample
+        size = _get_size(n, oversample)
+        self.half = size // 2
+        self.mu, self.m = _get_params(n, eps, oversample)
+        pad = (size - n) // 2  # where zero-padding stops
+        end = pad + n  # where f stops
+        self._inner = (..., *[slice(pad, end)] * ndim)
+        # The signs of the checkerboard before the FFT; the signs after the
+        # FFT differ by a constant factor because the grid width is even.
+        self._mask = checkerboard_mask(xp, [size] * ndim)
+        flip = _g(self.half)**ndim
+        self._mask_inverse = flip * self._mask
+        kernel = xp.exp(-self.mu * sum(
+            x**2 for x in xp.ogrid[(slice(-(n // 2), n - n // 2),) * ndim]))
+        kernel = (size**ndim * kernel).astype('float32')
+        self._deconvolve = self._mask[self._inner[1:]] / kernel
+        self._deconvolve_inverse = flip * self._deconvolve
+        self._buffer = xp.zeros([size] * ndim, dtype='complex64')
+
+    def eq2grid(self, f):
+        """Return the oversampled spectrum of f for gathering.
+
+        Leading dimensions of f beyond the last ndim are transformed
+        independently.
+        """
+        batch = f.shape[:f.ndim - self.ndim]
+        if self._buffer.shape[:len(self._buffer.shape) - self.ndim] != batch:
+            self._buffer = self.xp.zeros(
+                (*batch, *self._buffer.shape[-self.ndim:]),
+                dtype='complex64',
+            )
+        self._buffer[self._inner] = f * self._deconvolve
+        Fe = self.fftn(self._buffer, axes=self._axes(f))
+        Fe *= self._mask_inverse
+        return Fe
+
+    def grid2eq(self, G):
+        """Return the (n,) * ndim function from its scattered spectrum.
+
+        G is overwritten. Leading dimensions of G beyond the last ndim are
+        transformed independently.
+        """
+        G *= self._mask
+        F = self.fftn(G, axes=self._axes(G))
+        return F[self._inner] * self._deconvolve_inverse
+
+    def _axes(self, array):
+        """Return the last ndim axes of the array."""
+        return tuple(range(array.ndim - self.ndim, array.ndim))
+
+    def eq2us(self, f, x, gather=vector_gather):
+        """Return the USFFT of f at the unequally-spaced frequencies x."""
+        return gather(self.xp, self.eq2grid(f), x, self.half, self.m,
+                      self.mu)
+
+    def us2eq(self, f, x, scatter=vector_scatter):
+        """Return the adjoint USFFT of f from the frequencies x."""
+        return self.grid2eq(
+            scatter(self.xp, f, x, self.half, self.m, self.mu))
+
+
+def us2eq2d(f, x, n, eps, xp, scatter=vector_scatter2d, fftn=None,
+            oversample=2):
     """2d USFFT from unequally-spaced grid to equally-spaced grid.
 
     Parameters
@@ -307,25 +676,8 @@ def us2eq2d(f, x, n, eps, xp, scatter=vector_scatter2d, fftn=None):
     scatter : function
         The scatter function to use.
     """
-    fftn = xp.fft.fftn if fftn is None else fftn
-    pad = n // 2  # where zero-padding stops
-    end = pad + n  # where f stops
-
-    # parameters for the USFFT transform
-    mu = -xp.log(eps) / (2 * n**2)
-    Te = 1 / xp.pi * xp.sqrt(-mu * xp.log(eps) + (mu * n)**2 / 4)
-    m = xp.int(xp.ceil(2 * n * Te))
-
-    # smearing kernel (ker)
-    kernel = _get_kernel2d(xp, pad, mu)
-
-    G = scatter(xp, f, x, n, m, mu)
-
-    # FFT and compesantion for smearing
-    F = checkerboard(xp, fftn(checkerboard(xp, G)), inverse=True)
-    F = F[pad:end, pad:end] / ((2 * n)**2 * kernel)
-
-    return F
+    return USFFTPlan(n, eps, xp, ndim=2, fftn=fftn,
+                     oversample=oversample).us2eq(f, x, scatter)
 
 
 def _unpad(array, width, mode='wrap'):
@@ -381,3 +733,16 @@ def checkerboard(xp, array, axes=None, inverse=False):
             array *= _g(array.shape[-1] // 2)
         array = xp.moveaxis(array, -1, i)
     return array
+
+
+def checkerboard_mask(xp, shape, axes=None, inverse=False):
+    """Return the int8 signs multiplied by checkerboard as one array.
+
+    Multiplying by the mask is one pass over the array instead of one pass per
+    axis. The mask broadcasts against arrays with more leading dimensions.
+    """
+    axes = range(len(shape)) if axes is None else axes
+    mask = xp.ones(shape, dtype='int8')
+    checkerboard(xp, mask, axes=axes, inverse=inverse)
+    return mask[tuple(slice(None) if i in axes else slice(0, 1)
+                      for i in range(len(shape)))]
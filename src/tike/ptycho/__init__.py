@@ -5,4 +5,5 @@ environment variable.
 
 """
 from .ptycho import *
-from .position import check_allowed_positions
+from .position import (PositionIndex, check_allowed_positions, color_positions,
+                       get_fly_scan)
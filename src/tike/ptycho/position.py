@@ -1,3 +1,4 @@
+import itertools
 import logging
 
 import numpy as np
@@ -13,35 +14,40 @@ def check_allowed_positions(scan, psi, probe):
     allow approximating gradients and to provide better interpolation near the
     edges of the field of view.
     """
-    int_scan = scan // 1
-    less_than_one = int_scan < 1
-    greater_than_psi = np.stack(
-        (int_scan[..., -2] >= psi.shape[-2] - probe.shape[-2],
-         int_scan[..., -1] >= psi.shape[-1] - probe.shape[-1]),
-        -1,
-    )
-    if np.any(less_than_one) or np.any(greater_than_psi):
-        x = np.logical_or(less_than_one, greater_than_psi)
+    # Reduce each coordinate to its extremes with array methods, so that scan
+    # may be any array type; only index the offending positions when there
+    # are some.
+    limit = (psi.shape[-2] - probe.shape[-2], psi.shape[-1] - probe.shape[-1])
+    if (scan.min() < 1 or scan[..., 0].max() >= limit[0]
+            or scan[..., 1].max() >= limit[1]):
+        int_scan = scan // 1
+        x = np.logical_or(int_scan < 1, int_scan >= limit)
         raise ValueError("These scan positions exist outside field of view:\n"
                          f"{scan[np.logical_or(x[..., 0], x[..., 1])]}")
 
 
-def get_padded_object(scan, probe):
+def get_padded_object(scan, probe, overwrite=False):
     """Return a ones-initialized object and shifted scan positions.
 
     An complex object array is initialized with shape such that the area
     covered by the probe is padded on each edge by 1/8th the width of that
     dimenion. The scan positions are shifted to be centered in this newly
-    initialized object array.
+    initialized object array. The input scan is only modified when overwrite
+    is True.
     """
     # Shift scan positions to zeros
-    scan[..., 0] -= np.min(scan[..., 0])
-    scan[..., 1] -= np.min(scan[..., 1])
+    lo = np.min(scan[..., 0]), np.min(scan[..., 1])
+    span = np.max(scan[..., 0]) - lo[0], np.max(scan[..., 1]) - lo[1]
 
     # Add padding to scan positions of field-of-view / 8
-    span = np.max(scan[..., 0]), np.max(scan[..., 1])
-    scan[..., 0] += span[0] * 0.125
-    scan[..., 1] += span[1] * 0.125
+    shift = np.array(
+        [span[0] * 0.125 - lo[0], span[1] * 0.125 - lo[1]],
+        dtype=scan.dtype,
+    )
+    if overwrite:
+        scan += shift
+    else:
+        scan = scan + shift
 
     ntheta = probe.shape[0]
     height = probe.shape[-2] + int(span[0] * 1.25)
@@ -50,6 +56,327 @@ def get_padded_object(scan, probe):
     return np.ones((ntheta, height, width), dtype='complex64'), scan
 
 
+def get_fly_scan(trajectory, time, dwell, pixel_size, probe, fly=1,
+                 tkwargs=None):  # yapf: disable
+    """Return an object and fly scan positions for a continuous trajectory.
+
+    Each exposure is represented by fly positions at the middles of equal
+    divisions of its dwell, so the positions can be grouped with
+    Ptycho(fly=fly). The positions are converted to pixels, shifted into a
+    ones-initialized object as in get_padded_object, and checked against the
+    field of view from their extremes without another pass over them.
+
+    Parameters
+    ----------
+    trajectory : function(t, **tkwargs) -> ..., v, h
+        A trajectory such as from :py:mod:`tike.scan`. The last two outputs
+        are the vertical and horizontal positions.
+    time, dwell : (ntheta, nframe) float
+        The start and duration of each exposure.
+    pixel_size : float
+        The width of an object pixel in the units of the trajectory.
+    probe : (ntheta, ..., probe_shape, probe_shape) complex64
+        The probe.
+    fly : int
+        The number of positions per exposure.
+
+    Returns
+    -------
+    psi : (ntheta, nz, n) complex64
+        A ones-initialized object.
+    scan : (ntheta, nframe * fly, 2) float32
+        The scan positions in pixels.
+
+    """
+    tkwargs = dict() if tkwargs is None else tkwargs
+    time = np.asarray(time)
+    t = time[..., None] + np.asarray(dwell)[..., None] * (
+        (np.arange(fly) + 0.5) / fly)
+    position = trajectory(t=t.reshape(*time.shape[:-1], -1), **tkwargs)
+    scan = np.empty((*time.shape[:-1], time.shape[-1] * fly, 2),
+                    dtype='float32')
+    scan[..., 0] = position[-2]
+    scan[..., 1] = position[-1]
+    scan /= pixel_size
+    psi, scan = get_padded_object(scan, probe, overwrite=True)
+    # After padding, the extremes of each coordinate are span / 8 and
+    # 9 / 8 * span, which are allowed as long as the span is at least 8
+    # pixels; the object is then at least 10 pixels wider than the probe.
+    if min(psi.shape[-2] - probe.shape[-2], psi.shape[-1] - probe.shape[-1],
+           ) < 10:  # yapf: disable
+        raise ValueError("The scan must span at least 8 pixels in each "
+                         "direction; decrease the pixel_size.")
+    return psi, scan
+
+
+def _expand_ranges(start, count):
+    """Return the group and value of each entry of the integer ranges."""
+    group = np.repeat(np.arange(len(count)), count)
+    first = np.repeat(start - np.cumsum(count) + count, count)
+    return group, first + np.arange(len(group))
+
+
+class PositionIndex():
+    """A grid of buckets for finding scan positions near other positions.
+
+    Positions are bucketed by the cell of a regular square grid which
+    contains them and the buckets are kept sorted, so only the buckets around
+    a query are searched. Queries are answered for many points at once, and
+    moving positions only re-buckets the ones which change cells.
+
+    Attributes
+    ----------
+    scan : (nscan, 2) float
+        The scan positions of one view; the minimum corners of the patches.
+    probe_shape : int
+        The pixel width of the patches. Bilinear interpolation extends each
+        patch by one pixel.
+    cell_size : float
+        The width of the grid cells. The default, probe_shape + 1, puts
+        overlapping patches in the same or adjacent cells.
+
+    """
+
+    _stride = 2**32
+    """The difference between the ids of vertically adjacent cells."""
+
+    def __init__(self, scan, probe_shape, cell_size=None):
+        """Please see help(PositionIndex) for more info."""
+        self.probe_shape = probe_shape
+        self.cell_size = probe_shape + 1 if cell_size is None else cell_size
+        self.scan = np.array(scan)
+        self.cells = self._cell(self.scan)
+        self.order = np.argsort(self.cells, kind='stable')
+        self.sorted_cells = self.cells[self.order]
+
+    def __len__(self):
+        return len(self.scan)
+
+    def _cell(self, x):
+        """Return the ids of the cells which contain x."""
+        cell = np.floor(np.asarray(x) / self.cell_size).astype('int64')
+        return cell[..., 0] * self._stride + cell[..., 1]
+
+    def _expand(self, start, end):
+        """Return the group and position of each entry of the sorted ranges."""
+        group, i = _expand_ranges(start, end - start)
+        return group, self.order[i]
+
+    def _candidates(self, cells, offsets):
+        """Return pairs of queries and positions in cells plus offsets.
+
+        The pairs are sorted by query.
+        """
+        offsets = np.array([dv * self._stride + dh for dv, dh in offsets])
+        neighbor = (cells[:, None] + offsets).ravel()
+        q, p = self._expand(
+            np.searchsorted(self.sorted_cells, neighbor, side='left'),
+            np.searchsorted(self.sorted_cells, neighbor, side='right'),
+        )
+        return q // len(offsets), p
+
+    def update(self, scan):
+        """Move the positions to scan; re-bucket those which change cells."""
+        scan = np.array(scan)
+        cells = self._cell(scan)
+        moved = np.flatnonzero(cells != self.cells)
+        self.scan, self.cells = scan, cells
+        if moved.size:
+            moving = np.zeros(len(cells), dtype='bool')
+            moving[moved] = True
+            stay = ~moving[self.order]
+            moved = moved[np.argsort(cells[moved], kind='stable')]
+            at = np.searchsorted(self.sorted_cells[stay], cells[moved],
+                                 side='right')
+            self.order = np.insert(self.order[stay], at, moved)
+            self.sorted_cells = np.insert(self.sorted_cells[stay], at,
+                                          cells[moved])
+
+    def overlaps(self):
+        """Return the pairs of positions whose patches overlap.
+
+        Returns
+        -------
+        i, j : (npair, ) int
+            The indices of the positions in each pair; i < j.
+
+        """
+        reach = int(self.probe_shape // self.cell_size) + 1
+        # Search half of the neighboring cells, so each pair is found once
+        forward = [
+            offset
+            for offset in itertools.product(range(-reach, reach + 1), repeat=2)
+            if offset > (0, 0)
+        ]
+        i0, j0 = self._candidates(self.cells, [(0, 0)])
+        i1, j1 = self._candidates(self.cells, forward)
+        i = np.concatenate((i0[i0 < j0], i1))
+        j = np.concatenate((j0[i0 < j0], j1))
+        # Patches span probe_shape + 1 pixels, so patches overlap when their
+        # corners are at most probe_shape apart in both directions.
+        corner = np.floor(self.scan)
+        keep = np.all(np.abs(corner[i] - corner[j]) <= self.probe_shape, -1)
+        i, j = i[keep], j[keep]
+        return np.minimum(i, j), np.maximum(i, j)
+
+    def nearest(self, points, k=1):
+        """Return the k positions nearest to each point.
+
+        Parameters
+        ----------
+        points : (npoint, 2) float
+            The query points.
+        k : int
+            The number of positions to find.
+
+        Returns
+        -------
+        distance : (npoint, k) float
+            The distances to the positions from nearest to farthest; infinite
+            where there are fewer than k positions.
+        index : (npoint, k) int
+            The indices of the positions; -1 where there are fewer than k.
+
+        """
+        points = np.asarray(points)
+        cells = self._cell(points)
+        distance = np.full((len(points), k), np.inf)
+        index = np.full((len(points), k), -1)
+        if not len(self):
+            return distance, index
+        # Search rings of cells of increasing radius around the points until
+        # the kth nearest position is closer than any unsearched cell or every
+        # occupied cell has been searched.
+        occupied = np.floor(
+            np.stack((np.min(self.scan, axis=0), np.max(self.scan, axis=0))) /
+            self.cell_size)
+        query = np.floor(points / self.cell_size)
+        last = np.max(np.maximum(np.abs(query - occupied[0]),
+                                 np.abs(query - occupied[1])), axis=-1)
+        todo = np.arange(len(points))
+        radius, searched = 1, -1
+        while todo.size:
+            ring = [(dv, dh)
+                    for dv, dh in itertools.product(range(-radius, radius + 1),
+                                                    repeat=2)
+                    if max(abs(dv), abs(dh)) > searched]
+            q, p = self._candidates(cells[todo], ring)
+            # Merge with the current nearest positions in a table with one row
+            # per point and keep the k nearest of each row
+            count = np.bincount(q, minlength=len(todo))
+            column = k + np.arange(len(q)) - np.repeat(np.cumsum(count) - count,
+                                                       count)
+            d = np.full((len(todo), k + np.max(count)), np.inf)
+            i = np.full(d.shape, -1)
+            d[:, :k], i[:, :k] = distance[todo], index[todo]
+            d[q, column] = np.linalg.norm(points[todo[q]] - self.scan[p],
+                                          axis=-1)
+            i[q, column] = p
+            order = np.argsort(d, axis=-1, kind='stable')[:, :k]
+            distance[todo] = np.take_along_axis(d, order, axis=-1)
+            index[todo] = np.take_along_axis(i, order, axis=-1)
+            done = ((distance[todo, -1] <= radius * self.cell_size) |
+                    (last[todo] <= radius))
+            todo = todo[~done]
+            searched = radius
+            radius += 1
+        return distance, index
+
+    def region(self, lo, hi):
+        """Return the positions in each rectangle lo <= scan < hi.
+
+        Parameters
+        ----------
+        lo, hi : (nregion, 2) float
+            The minimum and maximum corners of the rectangles.
+
+        Returns
+        -------
+        indices : list of (n, ) int
+            The indices of the positions in each rectangle in ascending order.
+
+        """
+        lo, hi = np.atleast_2d(lo), np.atleast_2d(hi)
+        first = np.floor(lo / self.cell_size).astype('int64')
+        last = np.floor(hi / self.cell_size).astype('int64')
+        # Each row of cells in a rectangle is a range of the sorted ids
+        nrow = np.maximum(last[:, 0] - first[:, 0] + 1, 0)
+        region, row = _expand_ranges(first[:, 0], nrow)
+        start = np.searchsorted(self.sorted_cells,
+                                row * self._stride + first[region, 1],
+                                side='left')
+        end = np.searchsorted(self.sorted_cells,
+                              row * self._stride + last[region, 1],
+                              side='right')
+        r, p = self._expand(start, np.maximum(start, end))
+        r = region[r]
+        keep = np.all((lo[r] <= self.scan[p]) & (self.scan[p] < hi[r]), -1)
+        r, p = r[keep], p[keep]
+        order = np.lexsort((p, r))
+        r, p = r[order], p[order]
+        return np.split(p, np.cumsum(np.bincount(r, minlength=len(lo)))[:-1])
+
+
+def color_positions(scan, probe_shape):
+    """Return colors for scan positions whose patches of psi do not overlap.
+
+    Patches of the same color never touch the same pixel of psi, so the
+    patches of one color may be added to psi at the same time with plain
+    stores instead of atomic or locked additions. Positions are colored
+    greedily in order of their vertical coordinate; each is given the least
+    color which none of its already colored neighbors have.
+
+    Parameters
+    ----------
+    scan : (..., nscan, 2) float32
+        The scan positions; each is the minimum corner of a patch.
+    probe_shape : int
+        The pixel width of the patches. Bilinear interpolation extends each
+        patch by one pixel.
+
+    Returns
+    -------
+    colors : (..., nscan) int
+        The color of each position; colors are numbered from zero.
+
+    """
+    scan = np.asarray(scan)
+    colors = np.empty(scan.shape[:-1], dtype='int64')
+    for scan1, colors1 in zip(
+            scan.reshape(-1, *scan.shape[-2:]),
+            colors.reshape(-1, colors.shape[-1]),
+    ):
+        colors1[:] = _color_graph(
+            *PositionIndex(scan1, probe_shape).overlaps(),
+            order=np.argsort(np.floor(scan1[:, 0]), kind='stable'),
+        )
+    return colors
+
+
+def _color_graph(i, j, order):
+    """Greedily color the graph with edges (i, j) visiting nodes in order.
+
+    Each node is given the least color which none of its neighbors visited
+    before it have. Edges may be repeated and edges from a node to itself are
+    ignored.
+    """
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    keep = i != j
+    i, j = rank[i[keep]], rank[j[keep]]
+    # For each node, list the neighbors visited before it
+    before, after = np.minimum(i, j), np.maximum(i, j)
+    sort = np.argsort(after, kind='stable')
+    before = before[sort]
+    bounds = np.searchsorted(after[sort], np.arange(len(order) + 1))
+    sorted_colors = np.empty(len(order), dtype='int64')
+    for k in range(len(order)):
+        neighbors = sorted_colors[before[bounds[k]:bounds[k + 1]]]
+        used = np.bincount(neighbors, minlength=len(neighbors) + 1)
+        sorted_colors[k] = np.argmin(used)
+    return sorted_colors[rank]
+
+
 def _lstsq(a, b, xp):
     """Return the least-squares solution for a @ x = b.
 
@@ -102,30 +429,29 @@ def update_positions_pd(operator, data, psi, probe, scan,
     intensity = operator._compute_intensity(data, psi, scan, probe)
     dI = (data - intensity).reshape(*data.shape[:-2], np.prod(data.shape[-2:]))
 
-    dI_dx, dI_dy = 0, 0
-    for m in range(probe.shape[-3]):
-
-        # step 2: the partial derivatives of wavefront respect to position
-        farplane = operator.fwd(psi=psi,
-                                scan=scan,
-                                probe=probe[..., m:m + 1, :, :])
-        dfarplane_dx = (farplane - operator.fwd(
-            psi=psi,
-            probe=probe[..., m:m + 1, :, :],
-            scan=scan + operator.xp.array((0, dx), dtype='float32'),
-        )) / dx
-        dfarplane_dy = (farplane - operator.fwd(
-            psi=psi,
-            probe=probe[..., m:m + 1, :, :],
-            scan=scan + operator.xp.array((dx, 0), dtype='float32'),
-        )) / dx
-
-        # step 3: the partial derivatives of intensity respect to position
-        dI_dx += 2 * np.real(dfarplane_dx * farplane.conj()).reshape(
-            *data.shape[:2], -1, *data.shape[2:])
-
-        dI_dy += 2 * np.real(dfarplane_dy * farplane.conj()).reshape(
-            *data.shape[:2], -1, *data.shape[2:])
+    # step 2: the partial derivatives of wavefront respect to position; the
+    # shifted scans are used once, so they are not cached.
+    farplane = operator.fwd(psi=psi, scan=scan, probe=probe)
+    dfarplane_dx = (farplane - operator.fwd(
+        psi=psi,
+        probe=probe,
+        scan=scan + operator.xp.array((0, dx), dtype='float32'),
+        cache=False,
+    )) / dx
+    dfarplane_dy = (farplane - operator.fwd(
+        psi=psi,
+        probe=probe,
+        scan=scan + operator.xp.array((dx, 0), dtype='float32'),
+        cache=False,
+    )) / dx
+
+    # step 3: the partial derivatives of intensity respect to position summed
+    # over the probe modes
+    dI_dx = 2 * np.sum(np.real(dfarplane_dx * farplane.conj()), axis=-3)
+    dI_dx = dI_dx.reshape(*data.shape[:2], -1, *data.shape[2:])
+
+    dI_dy = 2 * np.sum(np.real(dfarplane_dy * farplane.conj()), axis=-3)
+    dI_dy = dI_dy.reshape(*data.shape[:2], -1, *data.shape[2:])
 
     # step 4: solve for ΔX, ΔY using least squares
     dI_dxdy = np.stack((dI_dy.reshape(*dI.shape), dI_dx.reshape(*dI.shape)),
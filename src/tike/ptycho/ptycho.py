@@ -103,37 +103,96 @@ def simulate(
         detector_shape,
         probe, scan,
         psi,
+        fly=1, chunk_size=None, out=None, num_workers=1,
         **kwargs
 ):  # yapf: disable
-    """Return real-valued detector counts of simulated ptychography data."""
+    """Return real-valued detector counts of simulated ptychography data.
+
+    The data are simulated in chunks of consecutive frames. The intensities of
+    the probe modes and fly positions of each chunk are summed as they are
+    computed, and each chunk is written to `out` as soon as it is done, so
+    only one chunk of farplane per worker is ever in memory.
+
+    Parameters
+    ----------
+    probe : (ntheta, :, :, nmode, probe_shape, probe_shape) complex64
+        The illumination function; one probe for all positions or one for
+        each position. The second and third dimensions are 1 or nscan // fly
+        and 1 or fly.
+    scan : (ntheta, nscan, 2) float32
+        The scan positions in the coordinates of psi.
+    psi : (ntheta, nz, n) complex64
+        The object.
+    fly : int
+        The number of consecutive scan positions summed into each frame.
+    chunk_size : int
+        The number of frames simulated at once. Defaults to all of them.
+    out : (ntheta, nscan // fly, detector_shape, detector_shape) array-like
+        Where to write the data; any array which supports assignment to
+        slices such as a numpy.memmap or an h5py or zarr dataset. A new
+        float32 array by default.
+    num_workers : int
+        The number of chunks simulated in parallel by a
+        :py:class:`tike.pool.ThreadPool`.
+
+    Returns
+    -------
+    out : (ntheta, nscan // fly, detector_shape, detector_shape) float32
+        The square of the absolute value of the farplane summed over modes and
+        fly positions.
+
+    """
     assert scan.ndim == 3
     assert psi.ndim == 3
     check_allowed_positions(scan, psi, probe)
+    ntheta, nframe = scan.shape[0], scan.shape[-2] // fly
+    chunk_size = nframe if chunk_size is None else chunk_size
+    if out is None:
+        out = np.empty(
+            (ntheta, nframe, detector_shape, detector_shape),
+            dtype='float32',
+        )
     with Ptycho(
             probe_shape=probe.shape[-1],
             detector_shape=int(detector_shape),
             nz=psi.shape[-2],
             n=psi.shape[-1],
-            ntheta=scan.shape[0],
+            ntheta=ntheta,
+            fly=fly,
             **kwargs,
-    ) as operator:
-        data = 0
-        for mode in np.split(probe, probe.shape[-3], axis=-3):
-            farplane = operator.fwd(
-                probe=operator.asarray(mode, dtype='complex64'),
-                scan=operator.asarray(scan, dtype='float32'),
-                psi=operator.asarray(psi, dtype='complex64'),
-                **kwargs,
-            )
-            data += np.square(
-                np.linalg.norm(
-                    farplane.reshape(operator.ntheta,
-                                     scan.shape[-2] // operator.fly, -1,
-                                     detector_shape, detector_shape),
-                    ord=2,
-                    axis=2,
+    ) as operator, ThreadPool(num_workers) as pool:
+        # The object, and the probe if shared by all positions, are copied to
+        # each worker once; positions and per-position probes are copied by
+        # the chunk.
+        psi = pool.bcast(np.asarray(psi, dtype='complex64'))
+        shared = probe.shape[-5] == 1
+        if shared:
+            probe = pool.bcast(np.asarray(probe, dtype='complex64'))
+
+        def simulate_chunk(psi, probe, lo):
+            hi = min(lo + chunk_size, nframe)
+            if not shared:
+                probe = operator.asarray(probe[..., lo:hi, :, :, :, :],
+                                         dtype='complex64')
+            chunk_scan = operator.asarray(scan[..., lo * fly:hi * fly, :],
+                                          dtype='float32')
+            farplane = operator.fwd(probe=probe, scan=chunk_scan, psi=psi)
+            out[:, lo:hi] = operator.asnumpy(
+                np.sum(np.square(np.abs(farplane)), axis=(2, 3)))
+
+        chunks = range(0, nframe, chunk_size)
+        for i in range(0, len(chunks), pool.num_workers):
+            group = chunks[i:i + pool.num_workers]
+            # Consume the results to raise any errors from the workers
+            list(
+                pool.map(
+                    simulate_chunk,
+                    psi[:len(group)],
+                    probe[:len(group)] if shared else [probe] * len(group),
+                    group,
                 ))
-        return operator.asnumpy(data)
+    return out
+
 
 def reconstruct(
         data,
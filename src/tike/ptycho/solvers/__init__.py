@@ -3,10 +3,12 @@
 # from .admm import admm, admm1
 from .combined import combined
 # from .divided import divided
+from .rpie import rpie
 
 __all__ = [
     # "admm",
     # "admm1",
     "combined",
     # "divided",
+    "rpie",
 ]
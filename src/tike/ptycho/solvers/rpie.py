@@ -0,0 +1,145 @@
+import logging
+
+import numpy as np
+
+from ..position import PositionIndex, _color_graph, update_positions_pd
+
+logger = logging.getLogger(__name__)
+
+
+def rpie(
+    op,
+    pool,
+    num_gpu, data, probe, scan, psi,
+    recover_psi=True, recover_probe=True, recover_positions=False,
+    alpha=0.05, beta=0.05,
+    **kwargs
+):  # yapf: disable
+    """Solve the ptychography problem with batched regularized PIE.
+
+    Each epoch visits every frame once. Frames are visited in batches whose
+    patches do not overlap, so the object is updated for all of the frames of
+    a batch at once without conflicts, and the probe is updated by the sum of
+    the updates of the batch. The fly positions of a frame overlap, so the
+    object update is normalized by the illumination of all of them.
+
+    Parameters
+    ----------
+    alpha, beta : float [0, 1]
+        The regularization of the object and probe updates. Smaller values
+        take larger steps where the probe or object is weak.
+
+    References
+    ----------
+    Maiden, Andrew, Daniel Johnson, and Peng Li. 2017. “Further Improvements
+    to the Ptychographical Iterative Engine.” Optica 4 (7): 736.
+    https://doi.org/10.1364/OPTICA.4.000736.
+
+    """
+    # TODO: add multi-GPU support
+    if (num_gpu > 1):
+        split = np.cumsum([s.shape[1] for s in scan])[:-1]
+        scan = pool.gather(scan, axis=1)
+        data = pool.gather(data, axis=1)
+        psi = psi[0]
+        probe = probe[0]
+
+    psi = psi.copy()
+    probe = probe.copy()
+    pad, end = op.diffraction.pad, op.diffraction.end
+    unit = op.xp.ones((*probe.shape[:-5], 1, 1, 1, *probe.shape[-2:]),
+                      dtype='complex64')
+
+    colors = _color_frames(op.asnumpy(scan), probe.shape[-1], op.fly)
+    for color in range(np.max(colors) + 1):
+        frames = np.flatnonzero(colors == color)
+        positions = (frames[:, None] * op.fly + np.arange(op.fly)).ravel()
+        frames, positions = op.asarray(frames), op.asarray(positions)
+        bscan = scan[..., positions, :]
+        bdata = data[:, frames]
+        bprobe = probe if probe.shape[-5] == 1 else probe[:, frames]
+
+        farplane = op.fwd(psi=psi, scan=bscan, probe=bprobe)
+        intensity = op._sum_intensity(farplane, bdata.shape)
+        # The exit wave correction of the projection onto the measured
+        # modulus
+        nearplane = op.propagation.adj(
+            farplane * (
+                np.sqrt(bdata) / (np.sqrt(intensity) + 1e-32) - 1
+            )[:, :, np.newaxis, np.newaxis],
+            overwrite=True,
+        )  # yapf: disable
+
+        if recover_probe:
+            # The object patches before the object is updated
+            patches = op.diffraction.fwd(psi=psi, scan=bscan, probe=unit)
+            patches = patches[..., pad:end, pad:end]
+
+        if recover_psi:
+            # The illumination of the object by all positions of the batch
+            power = np.zeros_like(nearplane[..., :1, :, :])
+            power[..., pad:end, pad:end] = np.sum(
+                np.square(np.abs(bprobe)),
+                axis=-3,
+                keepdims=True,
+            )
+            power = op.diffraction.adj(
+                nearplane=power,
+                scan=bscan,
+                probe=unit,
+            ).real
+            power = ((1 - alpha) * power +
+                     alpha * np.max(power, axis=(-2, -1), keepdims=True))
+            psi += op.diffraction.adj(
+                nearplane=nearplane,
+                scan=bscan,
+                probe=bprobe,
+            ) / (power + 1e-32)
+
+        if recover_probe:
+            power = np.square(np.abs(patches))
+            power = ((1 - beta) * power +
+                     beta * np.max(power, axis=(-2, -1), keepdims=True))
+            update = patches.conj() * nearplane[..., pad:end, pad:end]
+            # Sum the updates of the frames and positions which share a probe
+            shared = tuple(i for i in (1, 2) if probe.shape[i] == 1)
+            update = (np.sum(update, axis=shared, keepdims=True) /
+                      np.sum(power, axis=shared, keepdims=True))
+            if probe.shape[-5] == 1:
+                probe += update
+            else:
+                probe[:, frames] += update
+
+    if recover_positions:
+        scan, _ = update_positions_pd(op, data, psi, probe, scan)
+
+    cost = op.cost(data, psi, scan, probe)
+    logger.info('%10s cost is %+12.5e', 'rpie', cost)
+
+    if (num_gpu > 1):
+        psi = pool.bcast(psi)
+        probe = pool.bcast(probe)
+        scan = [
+            op.asarray(part, device=i)
+            for i, part in enumerate(np.split(scan, split, axis=1))
+        ]
+
+    return {'psi': psi, 'probe': probe, 'cost': cost, 'scan': scan}
+
+
+def _color_frames(scan, probe_shape, fly):
+    """Return colors for frames whose patches do not overlap in any view.
+
+    A frame is fly consecutive positions. The same frames are used in every
+    view, so frames conflict when their patches overlap in any of the views.
+    """
+    i, j = [], []
+    for scan1 in scan:
+        a, b = PositionIndex(scan1, probe_shape).overlaps()
+        i.append(a // fly)
+        j.append(b // fly)
+    return _color_graph(
+        np.concatenate(i),
+        np.concatenate(j),
+        order=np.argsort(np.floor(scan[0, ::fly, 0]), kind='stable'),
+    )
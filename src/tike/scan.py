@@ -58,6 +58,8 @@ __copyright__ = "Copyright (c) 2018, UChicago Argonne, LLC."
 __docformat__ = 'restructuredtext en'
 __all__ = [
     'scantimes',
+    'iscantimes',
+    'itrajectory',
     'sinusoid',
     'triangle',
     'triangle_fs',
@@ -72,10 +74,14 @@ __all__ = [
     'avgspeed',
     'lengths',
     'distance',
+    'ilengths',
+    'idistance',
+    'iavgspeed',
     'billiard',
     'hexagonal',
 ]
 
+import itertools
 import logging
 import numpy as np
 
@@ -140,7 +146,43 @@ def period(f):
 
 def scantimes(t0, t1, f=60):
     """Return times in the range [t0, t1) at the given frequency (f)."""
-    return np.linspace(t0, t1, (t1 - t0) * f, endpoint=False)
+    return np.linspace(t0, t1, int(round((t1 - t0) * f)), endpoint=False)
+
+
+def iscantimes(t0, t1, f=60, chunk_size=65536):
+    """Yield the times of scantimes(t0, t1, f) in chunks of chunk_size."""
+    num = int(round((t1 - t0) * f))
+    # The same arithmetic as numpy.linspace
+    step = (t1 - t0) / num if num > 0 else 0
+    for lo in range(0, num, chunk_size):
+        yield np.arange(lo, min(lo + chunk_size, num), dtype=float) * step + t0
+
+
+def itrajectory(trajectory, t0, t1, f=60, chunk_size=65536, tkwargs=None):
+    """Yield the positions of a trajectory in chunks of chunk_size times.
+
+    Parameters
+    ----------
+    trajectory : function(t, **tkwargs)
+        Any trajectory from this module.
+    t0, t1, f : float
+        The trajectory is evaluated at scantimes(t0, t1, f).
+    tkwargs : dict
+        The other parameters of the trajectory.
+
+    Yields
+    ------
+    t, position... : (chunk_size, ) np.array
+        The times and the coordinates returned by the trajectory at those
+        times.
+
+    """
+    tkwargs = dict() if tkwargs is None else tkwargs
+    for t in iscantimes(t0, t1, f, chunk_size):
+        position = trajectory(t=t, **tkwargs)
+        if not isinstance(position, tuple):
+            position = (position,)
+        yield (t, *position)
 
 
 def sinusoid(A, f, p, t):
@@ -382,14 +424,15 @@ def diagonal(A, B, fx, fy, px, py, t):
 
 def scan3(A, B, fx, fy, fz, px, py, time, hz):
     """Return a 3D combination of lissajous and sawtooth trajectories."""
-    x, y, t = lissajous(A, B, fx, fy, px, py, time, hz)
-    z = sawtooth(np.pi, 0.5 * fz, 0.5 * np.pi, t, hz)
+    t = scantimes(0, time, hz)
+    x, y = lissajous(A, B, fx, fy, px, py, t)
+    z = sawtooth(np.pi, 0.5 * fz, 0.5 * np.pi, t)
     return z, x, y, t
 
 
 def avgspeed(time, x, y=None, z=None):
     """Return the average speed along trajectory x, y, z if covered in time."""
-    return distance(z, x, y) / time
+    return distance(x, y, z) / time
 
 
 def lengths(x, y=None, z=None):
@@ -406,5 +449,53 @@ def lengths(x, y=None, z=None):
 
 def distance(x, y=None, z=None):
     """Return the total distance travelled along the trajectory x, y, z."""
-    d = lengths(z, x, y)
+    d = lengths(x, y, z)
     return np.sum(d)
+
+
+def ilengths(chunks):
+    """Yield the lengths between points of a trajectory given in chunks.
+
+    Parameters
+    ----------
+    chunks : iterable of (t, x[, y[, z]])
+        Consecutive chunks of a trajectory such as from :py:func:`itrajectory`.
+
+    Yields
+    ------
+    lengths : (chunk_size, ) np.array
+        The displacements from the previous point to each point in the chunk.
+        The first chunk is one shorter because it has no previous point.
+
+    """
+    last = None
+    for t, *position in chunks:
+        if last is not None:
+            position = [np.concatenate([a, b]) for a, b in zip(last, position)]
+        last = [x[-1:] for x in position]
+        yield lengths(*position)
+
+
+def idistance(chunks):
+    """Yield the distance travelled up to the end of each chunk.
+
+    See :py:func:`ilengths` for parameters.
+    """
+    total = 0
+    for d in ilengths(chunks):
+        total += np.sum(d)
+        yield total
+
+
+def iavgspeed(chunks):
+    """Yield the average speed up to the end of each chunk.
+
+    The average speed is the distance travelled since the first point divided
+    by the time since the first point. See :py:func:`ilengths` for
+    parameters.
+    """
+    chunks, positions = itertools.tee(chunks)
+    t0 = None
+    for (t, *_), total in zip(chunks, idistance(positions)):
+        t0 = t[0] if t0 is None else t0
+        yield total / (t[-1] - t0)
@@ -53,6 +53,8 @@ __docformat__ = 'restructuredtext en'
 __all__ = [
     'discrete_trajectory',
     'coded_exposure',
+    'coverage',
+    'bin_index',
 ]
 
 import logging
@@ -135,11 +137,7 @@ def discrete_trajectory(trajectory, tmin, tmax, xstep, tstep, tkwargs=None):
     dist_func = euclidian_dist_approx
     all_theta, all_v, all_h, all_times = discrete_helper(
         trajectory, tmin, tmax, xstep, tstep, dist_func, tkwargs=tkwargs)
-    all_theta = np.concatenate(all_theta)
-    all_v = np.concatenate(all_v)
-    all_h = np.concatenate(all_h)
-    all_times = np.concatenate(all_times)
-    # Compute dwell time because you can't while recursing
+    # Compute dwell time because you can't while refining
     dwell = np.empty(all_times.size)
     dwell[0:-1] = np.diff(all_times)
     dwell[-1] = tmax - all_times[-1]
@@ -158,47 +156,89 @@ def discrete_helper(
         trajectory, tmin, tmax, xstep, tstep, dist_func,
         tkwargs=None
 ):  # yapf: disable
-    """Do a recursive sampling of the trajectory."""
+    """Do an adaptive sampling of the trajectory.
+
+    The trajectory is sampled every tstep from tmin through tmax. Each run of
+    consecutive samples which are further apart than xstep is sampled again
+    with half the time step, until all of the samples are close enough. The
+    runs at each level of refinement are sampled together, then the levels
+    are spliced back into time order from the finest level up.
+
+    Returns
+    -------
+    theta, v, h, times : (N,) vectors
+        The samples which start each interval shorter than xstep.
+
+    """
     tkwargs = dict() if tkwargs is None else tkwargs
-    all_theta, all_v = list(), list()
-    all_h, all_times = list(), list()
-    # Sample en masse the trajectory over time
-    times = np.arange(tmin, tmax + tstep, tstep)
-    theta, v, h = trajectory(times, **tkwargs)
-    # Compute spatial distances between samples
-    distances = dist_func(theta, v, h)
-    # determine which ranges are too large and which to keep
-    keepit = xstep > distances
-    len_keepit = keepit.size
-    rlo, rhi, klo, khi = 0, 0, 0, 0
-    while khi < len_keepit:
-        khi += 1
-        rhi += 1
-        if not keepit[klo]:
-            klo += 1
-        elif khi == len_keepit or not keepit[rhi]:
-            # print("keep: {}, {}".format(klo, khi))
-            # concatenate the ranges to keep
-            all_theta.append(theta[klo:khi])
-            all_v.append(v[klo:khi])
-            all_h.append(h[klo:khi])
-            all_times.append(times[klo:khi])
-            klo = khi
-        if keepit[rlo]:
-            rlo += 1
-        elif rhi == len_keepit or keepit[rhi]:
-            # print("replace: {}, {} with {} tstep".format(rlo, rhi, tstep/2))
-            # concatenate the newly calculated region
-            itheta, ih, iv, itimes = discrete_helper(
-                trajectory, times[rlo], times[rhi], xstep, tstep / 2, dist_func,
-                tkwargs)
-            all_theta += itheta
-            all_v += iv
-            all_h += ih
-            all_times += itimes
-            rlo = rhi
-    khi += 1
-    return all_theta, all_v, all_h, all_times
+    lo, hi = np.array([tmin], dtype=float), np.array([tmax], dtype=float)
+    levels = list()
+    while lo.size > 0:
+        if np.any(lo + tstep <= lo):
+            raise ValueError(
+                "The trajectory cannot be sampled with steps less than "
+                f"{xstep}; the time step has vanished at {lo[0]}.")
+        times, segment = _arange_segments(lo, hi, tstep)
+        samples = np.stack([*trajectory(times, **tkwargs), times], axis=-1)
+        # Compute spatial distances between samples of the same range
+        inside = segment[:-1] == segment[1:]
+        keepit = xstep > dist_func(*samples[:, :3].T)
+        # A range is replaced by each run of intervals that are too long
+        replace = ~keepit & inside
+        first = replace.copy()
+        first[1:] &= ~replace[:-1]
+        last = replace.copy()
+        last[:-1] &= ~replace[1:]
+        # The intervals which are kept or replaced in time order
+        items = np.flatnonzero((keepit & inside) | first)
+        levels.append((
+            samples[items],
+            segment[items],
+            first[items],
+        ))
+        lo = times[:-1][first]
+        hi = times[1:][last]
+        tstep = tstep / 2
+
+    # Count the samples which replace each range from the finest level up
+    range_size = np.zeros(0, dtype=int)
+    sizes = list()
+    for samples, segment, is_run in reversed(levels):
+        size = np.ones(len(samples), dtype=int)
+        size[is_run] = range_size
+        sizes.append(size)
+        range_size = np.bincount(segment, weights=size, minlength=1)
+        range_size = range_size.astype(int)
+    # Place the samples of each level directly into the output
+    out = np.empty((range_size[0], 4))
+    range_start = np.zeros(1, dtype=int)
+    for (samples, segment, is_run), size in zip(levels, reversed(sizes)):
+        if len(samples) == 0:
+            continue
+        offset = np.cumsum(size) - size
+        # Offsets restart at the first item of each range
+        first_item = np.searchsorted(segment, np.arange(len(range_start)))
+        offset += (range_start - offset[np.minimum(first_item,
+                                                   len(offset) - 1)])[segment]
+        out[offset[~is_run]] = samples[~is_run]
+        range_start = offset[is_run]
+    return tuple(out.T)
+
+
+def _arange_segments(lo, hi, step):
+    """Return np.arange(lo, hi + step, step) for many ranges at once.
+
+    The samples match numpy.arange exactly and are labeled by their range.
+    """
+    length = np.maximum(np.ceil(((hi + step) - lo) / step), 0).astype(int)
+    segment = np.repeat(np.arange(lo.size), length)
+    index = np.arange(segment.size) - np.repeat(np.cumsum(length) - length,
+                                                length)
+    # numpy.arange fills from the difference between its first two values
+    start = lo[segment]
+    times = start + index * ((start + step) - start)
+    times[index == 1] = (start + step)[index == 1]
+    return times, segment
 
 
 def coded_exposure(theta, v, h, time, dwell, c_time, c_dwell):
@@ -232,61 +272,141 @@ def coded_exposure(theta, v, h, time, dwell, c_time, c_dwell):
         The starting index of each coded bundle.
 
     """
-    _fname = "coded_exposure"
     # Implementation uses the assumption that both the measurement times
-    # and coded times are monotonically increasing in order to generate the
-    # intersection faster than a binary search tree
+    # and coded times are monotonically increasing in order to join the
+    # intervals with binary searches
     assert (monotonic(time))
     assert (monotonic(c_time))
     # Check if any of the codes overlap with measurements
     if not has_overlap(time[0], dwell[-1] + time[-1] - time[0], c_time[0],
                        c_dwell[-1] + c_time[-1] - c_time[0]):
         raise ValueError("Codes don't overlap measurements.")
-        return list(), list(), list(), list(), list(), list()
-
-    # Find overlaps of individuals
-    start = 0  # Start searching here for the next code overlap
-    times = list()
-    dwells = list()  # store new coded times
-    positions = list()
-    codes = list()
-    for measurement in range(0, time.size):
-        found_atleast_one = False
-        logger.debug("{}: Measurement {}".format(_fname, measurement))
-        for code in range(start, c_time.size):
-            logger.debug("{}: Checking code {}".format(_fname, code))
-            if has_overlap(time[measurement], dwell[measurement], c_time[code],
-                           c_dwell[code]):
-                # Record the intersection
-                t1, d1 = get_overlap(time[measurement], dwell[measurement],
-                                     c_time[code], c_dwell[code])
-                if d1 > 0:
-                    logger.debug("{}: Overlap found: {}, {}".format(
-                        _fname, t1, d1))
-                    codes.append(code)
-                    positions.append(measurement)
-                    times.append(t1)
-                    dwells.append(d1)
-                    if not found_atleast_one:
-                        found_atleast_one = True
-                        # Always start searching at the start of last known
-                        # overlap
-                        start = code
-            elif found_atleast_one:
-                # This code is the one after the overlap
-                break
+
+    # Find the range of codes which may overlap each measurement: codes
+    # which start before the measurement ends, but not codes which all end
+    # before the measurement starts.
+    c_end = np.maximum.accumulate(c_time + c_dwell)
+    lo = np.searchsorted(c_end, time, side='right')
+    hi = np.searchsorted(c_time, time + dwell, side='left')
+    count = np.maximum(hi - lo, 0)
+    # Expand the ranges into candidate pairs of measurements and codes
+    positions = np.repeat(np.arange(time.size), count)
+    codes = (np.repeat(lo - np.cumsum(count) + count, count) +
+             np.arange(positions.size))
+    # Record the intersections which have some width
+    times = np.maximum(time[positions], c_time[codes])
+    dwells = np.minimum(time[positions] + dwell[positions],
+                        c_time[codes] + c_dwell[codes]) - times
+    overlap = dwells > 0
     # Reorder results to bundle all measurements within the same code
-    new_order = np.argsort(codes)
-    codes = np.array(codes)[new_order]
-    positions = np.array(positions)[new_order]
-    times1 = np.array(times)[new_order]
-    dwells1 = np.array(dwells)[new_order]
+    new_order = np.argsort(codes[overlap], kind='stable')
+    codes = codes[overlap][new_order]
+    positions = positions[overlap][new_order]
+    times1 = times[overlap][new_order]
+    dwells1 = dwells[overlap][new_order]
     # Clip the measurements
     bundles = np.nonzero(np.diff(np.concatenate([[-1], codes])))[0]
     return (theta[positions], v[positions], h[positions], times1, dwells1,
             bundles)
 
 
+def coverage(
+        theta, v, h, dwell=None, bins=[16, 8, 4],
+        probe_grid=[[1]], probe_shape=(0, 0),
+        chunk_size=65536,
+):  # yapf: disable
+    """Return a histogram of the sinogram space covered by the probe.
+
+    Each pixel of the probe grid is a ray offset from the probe position. The
+    rays of all pixels are binned together in chunks of measurements, so only
+    chunk_size measurements are expanded into rays at once.
+
+    Parameters
+    ----------
+    theta, v, h : (M, ) :py:class:`numpy.array`
+        The position of the probe at each measurement.
+    dwell : (M, ) :py:class:`numpy.array`
+        The duration of each measurement. Defaults to one.
+    bins : (3, ) int
+        The number of bins along theta in [0, pi), v in [-0.5, 0.5], and h in
+        [-0.5, 0.5].
+    probe_grid : (V, H) :py:class:`numpy.array`
+        The weight of each ray across the probe.
+    probe_shape : (2, ) float
+        The size of the probe along v and h.
+    chunk_size : int
+        The number of measurements binned at once.
+
+    Returns
+    -------
+    coverage : (bins) :py:class:`numpy.array`
+        The total weighted dwell of rays in each bin. Rays outside of the
+        range are ignored.
+
+    """
+    # Wrap theta into [0, pi)
+    theta = theta % (np.pi)
+    # Set default dwell value
+    if dwell is None:
+        dwell = np.ones(theta.shape)
+    # Make sure probe_grid is array
+    probe_grid = np.asarray(probe_grid)
+    # Create one ray for each pixel in the probe grid
+    dv, dh = np.meshgrid(
+        np.linspace(0, probe_shape[0], probe_grid.shape[0],
+                    endpoint=False) + probe_shape[0] / probe_grid.shape[0] / 2,
+        np.linspace(0, probe_shape[1], probe_grid.shape[1], endpoint=False) +
+        probe_shape[1] / probe_grid.shape[1] / 2,
+        indexing='ij',
+    )
+    rays = probe_grid.flatten() > 0
+    dv, dh = dv.flatten()[rays], dh.flatten()[rays]
+    weight = probe_grid.flatten()[rays]
+
+    H = np.zeros(np.prod(bins))
+    for lo in range(0, theta.size, chunk_size):
+        hi = lo + chunk_size
+        index, inside = bin_index(theta[lo:hi, None], 0, np.pi, bins[0])
+        for x, offset, n in zip((v, h), (dv, dh), bins[1:]):
+            i, within = bin_index(x[lo:hi, None] + offset, -.5, .5, n)
+            index = index * n + i
+            inside = inside & within
+        H += np.bincount(
+            index[inside],
+            weights=(dwell[lo:hi, None] * weight)[inside],
+            minlength=H.size,
+        )
+    return H.reshape(bins)
+
+
+def bin_index(x, lo, hi, n):
+    """Return the bin of x in n equal bins spanning [lo, hi].
+
+    Like numpy.histogram, the last bin includes hi.
+
+    Parameters
+    ----------
+    x : :py:class:`numpy.array`
+        The values to bin.
+    lo, hi : float
+        The range of the bins.
+    n : int
+        The number of bins.
+
+    Returns
+    -------
+    index : :py:class:`numpy.array` int
+        The bin of each value. Values outside of the range are clipped to
+        the first or last bin.
+    inside : :py:class:`numpy.array` bool
+        Whether each value is inside the range.
+
+    """
+    inside = (x >= lo) & (x <= hi)
+    index = np.floor((x - lo) * (n / (hi - lo))).astype(int)
+    return np.clip(index, 0, n - 1), inside
+
+
 def monotonic(x):
     """Check whether x is monomtically increasing."""
     dx = np.diff(x)
@@ -66,6 +66,8 @@ from matplotlib import ticker
 import matplotlib.pyplot as plt
 import numpy as np
 
+from tike.trajectory import coverage
+
 logger = logging.getLogger(__name__)
 
 
@@ -156,36 +158,14 @@ def plot_sino_coverage(
         theta, v, h, dwell=None, bins=[16, 8, 4],
         probe_grid=[[1]], probe_shape=(0, 0)
 ):  # yapf: disable
-    """Plot projections of minimum coverage in the sinogram space."""
-    # Wrap theta into [0, pi)
-    theta = theta % (np.pi)
-    # Set default dwell value
+    """Plot projections of minimum coverage in the sinogram space.
+
+    See :py:func:`tike.trajectory.coverage` for the parameters. Returns the
+    coverage relative to an ideal uniform coverage.
+    """
+    H = coverage(theta, v, h, dwell, bins, probe_grid, probe_shape)
     if dwell is None:
-        dwell = np.ones(theta.shape)
-    # Make sure probe_grid is array
-    probe_grid = np.asarray(probe_grid)
-    # Create one ray for each pixel in the probe grid
-    dv, dh = np.meshgrid(
-        np.linspace(0, probe_shape[0], probe_grid.shape[0],
-                    endpoint=False) + probe_shape[0] / probe_grid.shape[0] / 2,
-        np.linspace(0, probe_shape[1], probe_grid.shape[1], endpoint=False) +
-        probe_shape[1] / probe_grid.shape[1] / 2,
-    )
-
-    dv = dv.flatten()
-    dh = dh.flatten()
-    probe_grid = probe_grid.flatten()
-    H = np.zeros(bins)
-    for i in range(probe_grid.size):
-        if probe_grid[i] > 0:
-            # Compute histogram
-            sample = np.stack([theta, v + dv[i]], h + dh[i], axis=1)
-            dH, edges = np.histogramdd(
-                sample,
-                bins=bins,
-                range=[[0, np.pi], [-.5, .5], [-.5, .5]],
-                weights=dwell * probe_grid[i])
-            H += dH
+        dwell = np.ones(np.shape(theta))
     ideal_bin_count = np.sum(dwell) * np.sum(probe_grid) / np.prod(bins)
     H /= ideal_bin_count
     # Plot
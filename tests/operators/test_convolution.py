@@ -7,6 +7,7 @@ import numpy as np
 
 from .util import random_complex, inner_complex
 from tike.operators import Convolution
+from tike.operators.cupy.convolution import _patch_matrix
 
 __author__ = "Daniel Ching"
 __copyright__ = "Copyright (c) 2020, UChicago Argonne, LLC."
@@ -26,16 +27,16 @@ class TestConvolution(unittest.TestCase):
         self.fly = 9
         print(Convolution)
 
-    def test_adjoint(self):
+    def test_adjoint(self, nmode=1):
         """Check that the diffraction adjoint operator is correct."""
         np.random.seed(0)
         scan = np.random.rand(self.ntheta, self.nscan, 2) * (127 - 15 - 1)
         original = random_complex(*self.original_shape)
         nearplane = random_complex(self.ntheta, self.nscan // self.fly,
-                                   self.fly, 1, self.detector_shape,
+                                   self.fly, nmode, self.detector_shape,
                                    self.detector_shape)
         kernel = random_complex(self.ntheta, self.nscan // self.fly, self.fly,
-                                1, self.probe_shape, self.probe_shape)
+                                nmode, self.probe_shape, self.probe_shape)
 
         with Convolution(
                 ntheta=self.ntheta,
@@ -81,6 +82,78 @@ class TestConvolution(unittest.TestCase):
             op.xp.testing.assert_allclose(a.real, c.real, rtol=1e-5)
             op.xp.testing.assert_allclose(a.imag, c.imag, rtol=1e-5)
 
+    def test_adjoint_modes(self):
+        """Check the adjoint operator for all probe modes at once."""
+        self.test_adjoint(nmode=3)
+
+    def test_precompute(self):
+        """Check that the precomputed patch matrix matches the kernel."""
+        np.random.seed(0)
+        scan = np.random.rand(self.ntheta, self.nscan, 2) * (127 - 15 - 1)
+        original = random_complex(*self.original_shape)
+        nearplane = random_complex(self.ntheta, self.nscan // self.fly,
+                                   self.fly, 1, self.detector_shape,
+                                   self.detector_shape)
+        kernel = random_complex(self.ntheta, 1, 1, 1, self.probe_shape,
+                                self.probe_shape)
+        kwargs = {
+            'ntheta': self.ntheta,
+            'nz': self.original_shape[-2],
+            'n': self.original_shape[-1],
+            'probe_shape': self.probe_shape,
+            'detector_shape': self.detector_shape,
+            'fly': self.fly,
+        }
+        with Convolution(**kwargs) as op0, Convolution(
+                precompute=True,
+                **kwargs,
+        ) as op1:
+            scan = op0.asarray(scan.astype('float32'))
+            original = op0.asarray(original.astype('complex64'))
+            nearplane = op0.asarray(nearplane.astype('complex64'))
+            kernel = op0.asarray(kernel.astype('complex64'))
+            for _ in range(2):
+                op0.xp.testing.assert_allclose(
+                    op0.fwd(scan=scan, psi=original, probe=kernel),
+                    op1.fwd(scan=scan, psi=original, probe=kernel),
+                    rtol=1e-5,
+                    atol=1e-5,
+                )
+                op0.xp.testing.assert_allclose(
+                    op0.adj(nearplane=nearplane, scan=scan, probe=kernel),
+                    op1.adj(nearplane=nearplane, scan=scan, probe=kernel),
+                    rtol=1e-4,
+                    atol=1e-4,
+                )
+            # A scan which is used once is not kept
+            op0.xp.testing.assert_allclose(
+                op0.fwd(scan=scan + 1, psi=original, probe=kernel),
+                op1.fwd(scan=scan + 1, psi=original, probe=kernel,
+                        cache=False),
+                rtol=1e-5,
+                atol=1e-5,
+            )
+            assert len(op1.plans) == 1
+            # A copy of the scan reuses its matrix, but a scan changed in place
+            # does not
+            op1.fwd(scan=scan.copy(), psi=original, probe=kernel)
+            assert len(op1.plans) == 1
+            scan += 1
+            op0.xp.testing.assert_allclose(
+                op0.fwd(scan=scan, psi=original, probe=kernel),
+                op1.fwd(scan=scan, psi=original, probe=kernel),
+                rtol=1e-5,
+                atol=1e-5,
+            )
+            assert len(op1.plans) == 2
+
+    def test_precompute_too_large(self):
+        """Check that _patch_matrix refuses int32 overflows."""
+        nscan = 2**31 // (4 * self.probe_shape**2) + 1
+        scan = np.broadcast_to(np.ones(2, dtype='float32'), (1, nscan, 2))
+        with self.assertRaises(ValueError):
+            _patch_matrix(np, scan, self.probe_shape, 128, 128, None)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -6,6 +6,7 @@ import unittest
 import numpy as np
 
 from tike.operators import Flow
+from tike.operators.cupy.flow import _remap_lanczos, _remap_lanczos_adjoint
 from .util import random_complex, inner_complex
 
 __author__ = "Daniel Ching, Viktor Nikitin"
@@ -57,6 +58,83 @@ class TestFlow(unittest.TestCase):
             op.xp.testing.assert_allclose(a.real, b.real, rtol=1e-5)
             op.xp.testing.assert_allclose(a.imag, b.imag, rtol=1e-5)
 
+    def test_adj(self, dtype='complex64'):
+        """Check that Flow.adj is the adjoint of Flow.fwd for any flow."""
+        np.random.seed(0)
+        flow = 5 * (np.random.random([self.ntheta, self.nz, self.n, 2]) - 0.5)
+        original = random_complex(self.ntheta, self.nz, self.n)
+        data = random_complex(*original.shape)
+
+        with Flow() as op:
+            flow = op.asarray(flow, dtype='float32')
+            original = op.asarray(original.astype(dtype))
+            data = op.asarray(data.astype(dtype))
+
+            d = op.fwd(original, flow)
+            o = op.adj(data, flow)
+            assert d.dtype == dtype and o.dtype == dtype, (d.dtype, o.dtype)
+            a = inner_complex(d, data)
+            b = inner_complex(original, o)
+            op.xp.testing.assert_allclose(a.real, b.real, rtol=1e-5)
+            op.xp.testing.assert_allclose(a.imag, b.imag, rtol=1e-5)
+
+    def test_adj_real(self):
+        """Check that Flow.adj is the adjoint of Flow.fwd for real images."""
+        self.test_adj(dtype='float32')
+
+    def test_precompute(self, dtype='complex64'):
+        """Check that the precomputed remap matrix matches the filter."""
+        np.random.seed(0)
+        flow = 5 * (np.random.random([self.ntheta, self.nz, self.n, 2]) - 0.5)
+        original = random_complex(self.ntheta, self.nz, self.n)
+
+        with Flow() as op0, Flow(precompute=True) as op1:
+            flow = op0.asarray(flow, dtype='float32')
+            original = op0.asarray(original.astype(dtype))
+            for _ in range(2):
+                assert op1.fwd(original, flow).dtype == dtype
+                assert op1.adj(original, flow).dtype == dtype
+                op0.xp.testing.assert_allclose(
+                    op0.fwd(original, flow),
+                    op1.fwd(original, flow),
+                    atol=1e-5,
+                )
+                op0.xp.testing.assert_allclose(
+                    op0.adj(original, flow),
+                    op1.adj(original, flow),
+                    atol=1e-5,
+                )
+            # A flow which is modified in place needs a new matrix
+            flow += 1
+            op0.xp.testing.assert_allclose(
+                op0.fwd(original, flow),
+                op1.fwd(original, flow),
+                atol=1e-5,
+            )
+
+    def test_precompute_real(self):
+        """Check the precomputed remap matrix for real images."""
+        self.test_precompute(dtype='float32')
+
+    def test_chunks(self):
+        """Check that the remap does not depend on the chunk size."""
+        np.random.seed(0)
+        x = np.random.random([self.ntheta, self.nz * self.n, 2]) * self.n
+        x = x.astype('float32')
+        f = random_complex(self.ntheta, self.nz, self.n).astype('complex64')
+        g = random_complex(self.ntheta, self.nz * self.n).astype('complex64')
+        shape = (self.ntheta, self.nz, self.n)
+        np.testing.assert_allclose(
+            _remap_lanczos(np, f, x, 2),
+            _remap_lanczos(np, f, x, 2, chunk=3),
+            atol=1e-5,
+        )
+        np.testing.assert_allclose(
+            _remap_lanczos_adjoint(np, g, x, 2, shape),
+            _remap_lanczos_adjoint(np, g, x, 2, shape, chunk=3),
+            atol=1e-5,
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,11 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import tempfile
 import unittest
 
 import numpy as np
 
 from .util import random_complex, inner_complex
+import tike.operators.cupy.lamino
 from tike.operators import Lamino
 
 __author__ = "Daniel Ching, Viktor Nikitin"
@@ -56,6 +58,130 @@ class TestLamino(unittest.TestCase):
             op.xp.testing.assert_allclose(a.real, b.real, rtol=1e-2)
             op.xp.testing.assert_allclose(a.imag, b.imag, rtol=1e-2)
 
+    def test_precompute(self):
+        """Check that the precomputed interpolation matches the kernels."""
+        np.random.seed(0)
+        obj = random_complex(self.n, self.n, self.n)
+        data = random_complex(self.ntheta, self.n, self.n)
+        with Lamino(
+                n=self.n,
+                theta=self.theta,
+                tilt=self.tilt,
+                eps=self.eps,
+        ) as op0, Lamino(
+                n=self.n,
+                theta=self.theta,
+                tilt=self.tilt,
+                eps=self.eps,
+                precompute=True,
+        ) as op1:
+            obj = op0.asarray(obj.astype('complex64'))
+            data = op0.asarray(data.astype('complex64'))
+            op0.xp.testing.assert_allclose(op0.fwd(obj),
+                                           op1.fwd(obj),
+                                           rtol=1e-4,
+                                           atol=1e-4)
+            op0.xp.testing.assert_allclose(op0.adj(data),
+                                           op1.adj(data),
+                                           rtol=1e-4,
+                                           atol=1e-4)
+
+    def test_chunk_size(self):
+        """Check that transforming chunks of angles matches all at once."""
+        np.random.seed(0)
+        obj = random_complex(self.n, self.n, self.n)
+        data = random_complex(self.ntheta, self.n, self.n)
+        with Lamino(
+                n=self.n,
+                theta=self.theta,
+                tilt=self.tilt,
+                eps=self.eps,
+        ) as op0, Lamino(
+                n=self.n,
+                theta=self.theta,
+                tilt=self.tilt,
+                eps=self.eps,
+                chunk_size=3,
+        ) as op1:
+            obj = op0.asarray(obj.astype('complex64'))
+            op0.xp.testing.assert_allclose(op0.fwd(obj),
+                                           op1.fwd(obj),
+                                           rtol=1e-4,
+                                           atol=1e-4)
+            out = np.empty(data.shape, dtype='complex64')
+            op1.fwd(obj, out=out)
+            op0.xp.testing.assert_allclose(op0.fwd(obj),
+                                           op0.asarray(out),
+                                           rtol=1e-4,
+                                           atol=1e-4)
+            # data on the host is copied to the device one chunk at a time
+            data = data.astype('complex64')
+            op0.xp.testing.assert_allclose(op0.adj(op0.asarray(data)),
+                                           op1.adj(data),
+                                           rtol=1e-4,
+                                           atol=1e-4)
+            op0.xp.testing.assert_allclose(op0.grad(data, obj),
+                                           op1.grad(data, obj),
+                                           rtol=1e-4,
+                                           atol=1e-4)
+
+    def test_toeplitz(self):
+        """Check that the Toeplitz embedding matches cost and grad."""
+        np.random.seed(0)
+        obj = random_complex(self.n, self.n, self.n)
+        data = random_complex(self.ntheta, self.n, self.n)
+        with Lamino(
+                n=self.n,
+                theta=self.theta,
+                tilt=self.tilt,
+                eps=self.eps,
+        ) as op0, Lamino(
+                n=self.n,
+                theta=self.theta,
+                tilt=self.tilt,
+                eps=self.eps,
+                toeplitz=True,
+        ) as op1:
+            obj = op0.asarray(obj.astype('complex64'))
+            data = op0.asarray(data.astype('complex64'))
+            op0.xp.testing.assert_allclose(op0.grad(data, obj),
+                                           op1.grad(data, obj),
+                                           rtol=1e-3,
+                                           atol=1e-4)
+            op0.xp.testing.assert_allclose(op0.cost(data, obj),
+                                           op1.cost(data, obj),
+                                           rtol=1e-3)
+
+    def test_grid_cache(self):
+        """Check that operators with the same geometry share one grid."""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with Lamino(
+                    n=self.n,
+                    theta=self.theta,
+                    tilt=self.tilt,
+                    cache_dir=cache_dir,
+            ) as op0, Lamino(
+                    n=self.n,
+                    theta=self.theta.copy(),
+                    tilt=self.tilt,
+            ) as op1:
+                assert op0.xi is op1.xi
+                xi = op0.xi
+            with Lamino(
+                    n=self.n,
+                    theta=self.theta + 1,
+                    tilt=self.tilt,
+            ) as op2:
+                assert op2.xi is not xi
+            tike.operators.cupy.lamino._grid_cache.clear()
+            with Lamino(
+                    n=self.n,
+                    theta=self.theta,
+                    tilt=self.tilt,
+                    cache_dir=cache_dir,
+            ) as op3:
+                op3.xp.testing.assert_array_equal(op3.xi, xi)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -54,6 +54,32 @@ class TestShift(unittest.TestCase):
             op.xp.testing.assert_allclose(a.real, b.real, rtol=1e-5)
             op.xp.testing.assert_allclose(a.imag, b.imag, rtol=1e-5)
 
+    def test_real(self):
+        """Check that real arrays are shifted like complex arrays."""
+        np.random.seed(0)
+        shift = 4 * (np.random.random([self.ntheta, 2]) - 0.5)
+        original = random_complex(self.ntheta, self.nz, self.n)
+        with Shift() as op:
+            shift = op.asarray(shift, dtype='float32')
+            original = op.asarray(original.real, dtype='float32')
+            a = op.fwd(original.copy(), shift)
+            assert a.dtype == 'float32', a.dtype
+            b = op.fwd(original.astype('complex64'), shift).real
+            op.xp.testing.assert_allclose(a, b, atol=1e-5)
+
+    def test_zero_padding(self):
+        """Check that integer shifts without padding are circular."""
+        np.random.seed(0)
+        original = random_complex(self.ntheta, self.nz, self.n)
+        with Shift(padding=0) as op:
+            shift = op.asarray([[1, -2]] * self.ntheta, dtype='float32')
+            original = op.asarray(original, dtype='complex64')
+            op.xp.testing.assert_allclose(
+                op.fwd(original, shift),
+                op.xp.roll(original, (1, -2), axis=(-2, -1)),
+                atol=1e-5,
+            )
+
 
 if __name__ == '__main__':
     unittest.main()
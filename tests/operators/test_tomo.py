@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+
+from tike.operators import Tomo
+from .util import random_complex, inner_complex
+
+__author__ = "Daniel Ching, Viktor Nikitin"
+__copyright__ = "Copyright (c) 2020, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+
+
+class TestTomo(unittest.TestCase):
+    """Test the Tomography operator."""
+
+    def setUp(self, n=32, nz=3, ntheta=24, eps=1e-3):
+        """Load a dataset for reconstruction."""
+        self.n = n
+        self.nz = nz
+        self.ntheta = ntheta
+        self.theta = np.linspace(0, np.pi, ntheta, endpoint=False)
+        self.eps = eps
+        print(Tomo)
+
+    def test_adjoint(self):
+        """Check that the adjoint operator is correct."""
+        np.random.seed(0)
+        obj = random_complex(self.nz, self.n, self.n)
+        data = random_complex(self.ntheta, self.nz, self.n)
+
+        with Tomo(n=self.n, theta=self.theta, eps=self.eps) as op:
+
+            obj = op.asarray(obj.astype('complex64'))
+            data = op.asarray(data.astype('complex64'))
+
+            d = op.fwd(obj)
+            assert d.shape == data.shape
+            o = op.adj(data)
+            assert obj.shape == o.shape
+            a = inner_complex(d, data)
+            b = inner_complex(obj, o)
+            print()
+            print('<Robj,   data> = {:.6f}{:+.6f}j'.format(
+                a.real.item(), a.imag.item()))
+            print('<obj  , R*data> = {:.6f}{:+.6f}j'.format(
+                b.real.item(), b.imag.item()))
+            # Test whether Adjoint fixed probe operator is correct
+            op.xp.testing.assert_allclose(a.real, b.real, rtol=1e-2)
+            op.xp.testing.assert_allclose(a.imag, b.imag, rtol=1e-2)
+
+    def test_line_integral(self):
+        """Check that the projection at angle zero sums along the middle."""
+        obj = np.zeros([self.nz, self.n, self.n], dtype='complex64')
+        obj[:, 10:20, 12:16] = 1
+        with Tomo(n=self.n, theta=self.theta, eps=self.eps) as op:
+            np.testing.assert_allclose(
+                op.fwd(obj)[0],
+                obj.sum(axis=1),
+                atol=1e-2,
+            )
+
+    def test_precompute(self):
+        """Check that the precomputed interpolation matches the binning."""
+        np.random.seed(0)
+        obj = random_complex(self.nz, self.n, self.n).astype('complex64')
+        data = random_complex(self.ntheta, self.nz,
+                              self.n).astype('complex64')
+        with Tomo(
+                n=self.n,
+                theta=self.theta,
+                eps=self.eps,
+        ) as op0, Tomo(
+                n=self.n,
+                theta=self.theta,
+                eps=self.eps,
+                precompute=True,
+        ) as op1:
+            np.testing.assert_allclose(op0.fwd(obj),
+                                       op1.fwd(obj),
+                                       rtol=1e-4,
+                                       atol=1e-4)
+            np.testing.assert_allclose(op0.adj(data),
+                                       op1.adj(data),
+                                       rtol=1e-4,
+                                       atol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+
+from tike.operators.cupy.usfft import (
+    USFFTPlan,
+    binned_gather,
+    binned_scatter,
+    eq2us2d,
+    interpolation_matrix,
+    sparse_gather,
+    sparse_scatter,
+    us2eq2d,
+    vector_gather,
+    vector_gather2d,
+    vector_scatter,
+    vector_scatter2d,
+)
+from .util import random_complex
+
+__author__ = "Daniel Ching"
+__copyright__ = "Copyright (c) 2020, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+
+
+class TestUSFFT(unittest.TestCase):
+    """Test the gather and scatter functions of the USFFT."""
+
+    def setUp(self, n=8, nf=1000, eps=1e-3):
+        """Make random frequencies and kernel parameters."""
+        np.random.seed(0)
+        self.n = n
+        self.mu = -np.log(eps) / (2 * n**2)
+        Te = 1 / np.pi * np.sqrt(-self.mu * np.log(eps) + (self.mu * n)**2 / 4)
+        self.m = int(np.ceil(2 * n * Te))
+        self.x = (np.random.rand(nf, 3) - 0.5).astype('float32')
+        self.f = random_complex(nf).astype('complex64')
+        self.Fe = random_complex(*[2 * n] * 3).astype('complex64')
+
+    def test_binned_gather(self):
+        """Check that binned_gather matches vector_gather."""
+        a = vector_gather(np, self.Fe, self.x, self.n, self.m, self.mu)
+        b = binned_gather(np, self.Fe, self.x, self.n, self.m, self.mu)
+        np.testing.assert_allclose(a, b, rtol=1e-5, atol=1e-5)
+
+    def test_binned_scatter(self):
+        """Check that binned_scatter matches vector_scatter."""
+        a = vector_scatter(np, self.f, self.x, self.n, self.m, self.mu)
+        b = binned_scatter(np, self.f, self.x, self.n, self.m, self.mu,
+                           bin_size=4)
+        assert a.shape == b.shape
+        np.testing.assert_allclose(a, b, rtol=1e-5, atol=1e-5)
+
+    def test_binned_stack(self):
+        """Check that binned_* compute a stack like each of its grids."""
+        Fe = np.stack([self.Fe, 2 * self.Fe]).astype('complex64')
+        f = np.stack([self.f, 2j * self.f]).astype('complex64')
+        a = binned_gather(np, Fe, self.x, self.n, self.m, self.mu)
+        assert a.shape == (2, len(self.x)), a.shape
+        for a1, Fe1 in zip(a, Fe):
+            b1 = binned_gather(np, Fe1, self.x, self.n, self.m, self.mu)
+            np.testing.assert_allclose(a1, b1, rtol=1e-5, atol=1e-5)
+        a = binned_scatter(np, f, self.x, self.n, self.m, self.mu,
+                           bin_size=4)
+        assert a.shape == (2, *self.Fe.shape), a.shape
+        for a1, f1 in zip(a, f):
+            b1 = binned_scatter(np, f1, self.x, self.n, self.m, self.mu,
+                                bin_size=4)
+            np.testing.assert_allclose(a1, b1, rtol=1e-5, atol=1e-5)
+
+    def test_sparse_gather_scatter(self):
+        """Check that the interpolation_matrix matches vector_*."""
+        matrix = interpolation_matrix(np, self.x, self.n, self.m, self.mu)
+        a = vector_gather(np, self.Fe, self.x, self.n, self.m, self.mu)
+        b = sparse_gather(np, self.Fe, self.x, self.n, self.m, self.mu,
+                          matrix)
+        np.testing.assert_allclose(a, b, rtol=1e-5, atol=1e-5)
+        a = vector_scatter(np, self.f, self.x, self.n, self.m, self.mu)
+        b = sparse_scatter(np, self.f, self.x, self.n, self.m, self.mu,
+                           matrix)
+        np.testing.assert_allclose(a, b, rtol=1e-5, atol=1e-5)
+
+    def _direct(self):
+        """Return a random function and its direct Fourier sum kernel."""
+        u = random_complex(*[self.n] * 3).astype('complex64')
+        grid = np.arange(-self.n // 2, self.n // 2)
+        grid = np.stack(np.meshgrid(grid, grid, grid, indexing='ij'), axis=-1)
+        kernel = np.exp(-2j * np.pi * grid.reshape(-1, 3) @ self.x.T)
+        return u, kernel
+
+    def test_interpolation_matrix_too_large(self):
+        """Check that interpolation_matrix refuses int32 overflows."""
+        x = np.broadcast_to(self.x[:1], (2**31 // (2 * self.m)**3 + 1, 3))
+        with self.assertRaises(ValueError):
+            interpolation_matrix(np, x, self.n, self.m, self.mu)
+
+    def test_plan(self):
+        """Check that a reused USFFTPlan matches a direct Fourier sum."""
+        plan = USFFTPlan(self.n, 1e-6, np)
+        u, kernel = self._direct()
+        for _ in range(2):
+            np.testing.assert_allclose(
+                plan.eq2us(u, self.x),
+                u.ravel() @ kernel,
+                rtol=1e-4,
+                atol=1e-4 * np.linalg.norm(u),
+            )
+            np.testing.assert_allclose(
+                plan.us2eq(self.f, -self.x).ravel(),
+                kernel.conj() @ self.f,
+                rtol=1e-4,
+                atol=1e-4 * np.linalg.norm(self.f),
+            )
+
+    def test_oversample(self, eps=1e-3, oversample=1.5):
+        """Check that a smaller oversampling factor meets eps."""
+        plan = USFFTPlan(self.n, eps, np, oversample=oversample)
+        assert plan.half < self.n
+        u, kernel = self._direct()
+        a = plan.eq2us(u, self.x)
+        b = u.ravel() @ kernel
+        assert np.linalg.norm(a - b) < eps * np.linalg.norm(b)
+        a = plan.us2eq(self.f, -self.x).ravel()
+        b = kernel.conj() @ self.f
+        assert np.linalg.norm(a - b) < eps * np.linalg.norm(b)
+
+    def test_usfft2d(self, eps=1e-4):
+        """Check the 2D USFFT against a direct Fourier sum."""
+        x = self.x[:, :2]
+        u = random_complex(self.n, self.n).astype('complex64')
+        grid = np.arange(-self.n // 2, self.n // 2)
+        grid = np.stack(np.meshgrid(grid, grid, indexing='ij'), axis=-1)
+        kernel = np.exp(-2j * np.pi * grid.reshape(-1, 2) @ x.T)
+        for gather in [vector_gather2d, binned_gather]:
+            a = eq2us2d(u, x, self.n, eps, np, gather=gather)
+            b = u.ravel() @ kernel
+            assert np.linalg.norm(a - b) < eps * np.linalg.norm(b)
+        for scatter in [vector_scatter2d, binned_scatter]:
+            a = us2eq2d(self.f, -x, self.n, eps, np, scatter=scatter).ravel()
+            b = kernel.conj() @ self.f
+            assert np.linalg.norm(a - b) < eps * np.linalg.norm(b)
+
+    def test_binned_scatter2d_wide_kernel(self):
+        """Check binned_scatter in 2D when the kernel is wider than the grid."""
+        x = self.x[:, :2]
+        a, b = [
+            us2eq2d(self.f, x, self.n, 1e-3, np, scatter=scatter,
+                    oversample=1.25)
+            for scatter in [vector_scatter2d, binned_scatter]
+        ]
+        np.testing.assert_allclose(a, b, rtol=1e-5, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -76,6 +76,51 @@ class TestAlignRecon(unittest.TestCase):
         np.testing.assert_array_equal(shift.shape, self.shift.shape)
         np.testing.assert_allclose(shift, self.shift, atol=1e-3)
 
+    def test_align_cross_correlation_real(self):
+        """Check that cross_correlation works in chunks of real images."""
+        original = np.tile(np.abs(self.original), (3, 1, 1))
+        shift = np.tile(self.shift, (3, 1))
+        data = tike.align.simulate(original, shift).real
+        result = tike.align.reconstruct(
+            data,
+            original,
+            algorithm='cross_correlation',
+            upsample_factor=1e3,
+            chunk_size=2,
+        )
+        shift = result['shift']
+        assert shift.dtype == 'float32', shift.dtype
+        np.testing.assert_array_equal(shift.shape, (3, 2))
+        np.testing.assert_allclose(shift, np.tile(self.shift, (3, 1)),
+                                   atol=1e-2)
+
+    def test_align_pyramid(self):
+        """Check that cross_correlation works on an image pyramid."""
+        result = tike.align.reconstruct(
+            self.data,
+            self.original,
+            algorithm='cross_correlation',
+            upsample_factor=1e3,
+            num_levels=3,
+            num_iter=2,
+        )
+        shift = result['shift']
+        assert shift.dtype == 'float32', shift.dtype
+        np.testing.assert_array_equal(shift.shape, self.shift.shape)
+        np.testing.assert_allclose(shift, self.shift, atol=1e-3)
+
+    def test_align_cost(self):
+        """Check that the cost is computed for a single iteration."""
+        result = tike.align.reconstruct(
+            self.data,
+            self.original,
+            algorithm='cross_correlation',
+            upsample_factor=1e3,
+            num_levels=2,
+            num_iter=1,
+        )
+        assert result['cost'] >= 0, result['cost']
+
     @unittest.skipUnless('TIKE_BACKEND' in os.environ
                          and os.environ['TIKE_BACKEND'] == 'numpy',
                          "Farneback method only available on CPU.")
@@ -93,3 +138,62 @@ class TestAlignRecon(unittest.TestCase):
         np.testing.assert_allclose(shift[:, h // 2, w // 2, :],
                                    self.shift,
                                    atol=1e-1)
+
+
+def _rescale_8bit_histogram(a, b):
+    """Rescale a, b into the same 8-bit range with numpy.histogram."""
+    h, e = np.histogram(a, 1000)
+    stend = np.where(h > np.max(h) * 0.005)
+    lo = e[stend[0][0]]
+    hi = e[stend[0][-1] + 1]
+    a = np.clip(255 * (a - lo) / (hi - lo), 0, 255)
+    b = np.clip(255 * (b - lo) / (hi - lo), 0, 255)
+    return a, b
+
+
+class TestRescale8bit(unittest.TestCase):
+    """Test the 8-bit rescaling of the Farneback solver."""
+
+    def check(self, a, b):
+        """Check a stack of images against one histogram per image."""
+        from tike.align.solvers.farneback import _rescale_8bit
+        a1, b1 = _rescale_8bit(a.copy(), b.copy())
+        for i in range(len(a)):
+            finite = np.isfinite(a[i])
+            a2, b2 = _rescale_8bit_histogram(a[i][finite], b[i])
+            np.testing.assert_allclose(a1[i][finite], a2, rtol=1e-4, atol=1e-3)
+            np.testing.assert_allclose(b1[i], b2, rtol=1e-4, atol=1e-3)
+
+    def test_random(self):
+        """Check a stack of random images."""
+        np.random.seed(0)
+        a = np.random.normal(size=(3, 16, 17)).astype('float32')
+        b = np.random.normal(size=(3, 16, 17)).astype('float32')
+        self.check(a, b)
+
+    def test_constant(self):
+        """Check a constant image in a stack."""
+        np.random.seed(0)
+        a = np.random.rand(2, 16, 17).astype('float32')
+        a[1] = 0.25
+        b = np.random.rand(2, 16, 17).astype('float32')
+        self.check(a, b)
+
+    def test_nan(self):
+        """Check that values which are not finite are ignored."""
+        np.random.seed(0)
+        a = np.random.rand(2, 16, 17).astype('float32')
+        a[0, 3:5, 7] = np.nan
+        a[1, 0, 0] = np.inf
+        b = np.random.rand(2, 16, 17).astype('float32')
+        self.check(a, b)
+
+    def test_bin_edges(self):
+        """Check values which are rounded across the edges of the bins."""
+        np.random.seed(0)
+        lo, hi = np.float32(-0.13210486), np.float32(0.12573022)
+        edges = np.linspace(lo, hi, 1001, dtype='float32')
+        a = np.full((1, 16, 19), edges[500], dtype='float32')
+        a[0, 0, :4] = edges[[0, 1000, 53, 53]]
+        b = np.random.rand(1, 16, 19).astype('float32')
+        self.check(a, b)
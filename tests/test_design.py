@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test functions in tike.design."""
+
+import tike.scan
+from tike.design import score, search
+
+__author__ = "Daniel Ching"
+__copyright__ = "Copyright (c) 2020, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+
+
+def test_score_raster():
+    """Check design.score for a raster which covers the bins evenly."""
+    scores = score(
+        tike.scan.raster,
+        {'A': 1, 'B': 0.25, 'f': 1, 'x0': -0.5, 'y0': -0.5},
+        tmin=0,
+        tmax=4,
+        tstep=1 / 64,
+        bins=[1, 4, 4],
+    )
+    assert scores['coverage'] < 0.05, scores['coverage']
+    # The last row of bins is reached after three lines
+    assert 3 < scores['time'] < 4, scores['time']
+    assert scores['cost'] == scores['coverage']
+
+
+def test_search():
+    """Check that design.search prefers lissajous which fill the field."""
+    best = search(
+        tike.scan.lissajous,
+        {
+            'A': [0.05, 0.45],
+            'B': [0.05, 0.45],
+            'fx': [1, 2.1],
+            'fy': [1, 2.9],
+            'px': [0],
+            'py': [0],
+        },
+        tmin=0,
+        tmax=20,
+        tstep=0.01,
+        num_best=2,
+        num_workers=2,
+        bins=[1, 4, 4],
+    )
+    assert len(best) == 2
+    params, scores = best[0]
+    assert params['A'] == params['B'] == 0.45, params
+    assert params['fx'] != params['fy'], params
+    assert scores['cost'] <= best[1][1]['cost']
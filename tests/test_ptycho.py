@@ -53,6 +53,7 @@ import unittest
 
 import numpy as np
 
+import tike.operators
 import tike.ptycho
 
 __author__ = "Daniel Ching"
@@ -87,6 +88,108 @@ class TestPtychoUtils(unittest.TestCase):
             with self.assertRaises(ValueError):
                 tike.ptycho.check_allowed_positions(scan, psi, probe)
 
+    def test_check_allowed_positions_device(self):
+        """Check check_allowed_positions for scans on the device."""
+        psi = np.empty((7, 4, 9))
+        probe = np.empty((7, 1, 1, 8, 2, 2))
+        scan = tike.operators.Operator.asarray(
+            np.array([[1, 1], [1, 6.9], [1.1, 1], [1.9, 5.5]]))
+        tike.ptycho.check_allowed_positions(scan, psi, probe)
+        with self.assertRaises(ValueError):
+            tike.ptycho.check_allowed_positions(scan + 1, psi, probe)
+
+    def test_get_padded_object(self):
+        """Check that get_padded_object does not modify the scan."""
+        scan = np.array([[[3, 5], [23, 5], [3, 45]]], dtype='float32')
+        probe = np.empty((1, 1, 1, 1, 4, 4))
+        original = scan.copy()
+        psi, padded = tike.ptycho.position.get_padded_object(scan, probe)
+        np.testing.assert_array_equal(scan, original)
+        np.testing.assert_array_equal(padded, [[[2.5, 5], [22.5, 5],
+                                                [2.5, 45]]])
+        assert psi.shape == (1, 4 + 25, 4 + 50), psi.shape
+        tike.ptycho.check_allowed_positions(padded, psi, probe)
+
+    def test_color_positions(self, probe_shape=8):
+        """Check that patches of the same color do not overlap."""
+        np.random.seed(0)
+        scan = np.random.rand(2, 300, 2) * 100 + 1
+        colors = tike.ptycho.color_positions(scan, probe_shape)
+        assert colors.shape == scan.shape[:-1], colors.shape
+        # Bilinear patches cover probe_shape + 1 pixels
+        span = np.arange(probe_shape + 1)
+        for scan1, colors1 in zip(scan, colors):
+            psi0 = np.zeros((128, 128))
+            psi1 = np.zeros((128, 128))
+            for c in range(np.max(colors1) + 1):
+                corner = np.floor(scan1[colors1 == c]).astype(int)
+                rows = corner[:, 0, None, None] + span[:, None]
+                cols = corner[:, 1, None, None] + span
+                rows, cols = np.broadcast_arrays(rows, cols)
+                # Buffered assignment drops repeated indices
+                psi1[rows, cols] += 1
+                np.add.at(psi0, (rows, cols), 1)
+            np.testing.assert_array_equal(psi0, psi1)
+
+    def test_position_index(self, probe_shape=8):
+        """Check the queries of PositionIndex against brute force."""
+        np.random.seed(0)
+        scan = np.random.rand(500, 2) * 100
+        index = tike.ptycho.PositionIndex(scan, probe_shape)
+        for _ in range(2):
+            corner = np.floor(scan)
+            i, j = np.nonzero(
+                np.triu(
+                    np.all(np.abs(corner[:, None] - corner) <= probe_shape,
+                           axis=-1),
+                    k=1,
+                ))
+            a, b = index.overlaps()
+            np.testing.assert_array_equal(
+                np.sort(a * len(scan) + b),
+                i * len(scan) + j,
+            )
+
+            points = np.random.rand(20, 2) * 150 - 25
+            distance = np.linalg.norm(points[:, None] - scan, axis=-1)
+            d, k = index.nearest(points, k=3)
+            np.testing.assert_allclose(d, np.sort(distance, axis=-1)[:, :3])
+            np.testing.assert_allclose(np.take_along_axis(distance, k, -1), d)
+
+            lo = np.random.rand(5, 2) * 80
+            hi = lo + np.random.rand(5, 2) * 40
+            for r, lo1, hi1 in zip(index.region(lo, hi), lo, hi):
+                np.testing.assert_array_equal(
+                    r,
+                    np.flatnonzero(np.all((lo1 <= scan) & (scan < hi1), -1)),
+                )
+
+            # Move the positions and check the queries again
+            scan = scan + np.random.randn(*scan.shape) * 4
+            index.update(scan)
+
+    def test_get_fly_scan(self):
+        """Check that get_fly_scan samples each exposure fly times."""
+
+        def line(t):
+            return 0 * t, 3 * t, 2 * t
+
+        time = np.arange(10, dtype='float32')[None, :]
+        psi, scan = tike.ptycho.get_fly_scan(
+            line,
+            time,
+            dwell=np.full(time.shape, 0.5),
+            pixel_size=0.25,
+            probe=np.empty((1, 1, 1, 1, 8, 8)),
+            fly=2,
+        )
+        assert scan.shape == (1, 20, 2), scan.shape
+        assert scan.dtype == 'float32', scan.dtype
+        # Each exposure moves 0.5 * 3 / 0.25 pixels vertically
+        np.testing.assert_allclose(np.diff(scan[0, :, 0])[::2], 3)
+        np.testing.assert_allclose(np.diff(scan[0, :, 1])[::2], 2)
+        tike.ptycho.check_allowed_positions(scan, psi, np.empty((1, 8, 8)))
+
 
 class TestPtychoRecon(unittest.TestCase):
     """Test various ptychography reconstruction methods for consistency."""
@@ -161,6 +264,21 @@ class TestPtychoRecon(unittest.TestCase):
         np.testing.assert_array_equal(data.shape, self.data.shape)
         np.testing.assert_allclose(np.sqrt(data), np.sqrt(self.data), atol=1e-6)
 
+    def test_simulate_chunks(self):
+        """Check ptycho.simulate writes chunks in parallel to a target."""
+        out = np.zeros(self.data.shape, dtype='float32')
+        data = tike.ptycho.simulate(
+            detector_shape=self.data.shape[-1],
+            probe=self.probe,
+            scan=self.scan,
+            psi=self.original,
+            chunk_size=50,
+            out=out,
+            num_workers=2,
+        )
+        assert data is out
+        np.testing.assert_allclose(np.sqrt(data), np.sqrt(self.data), atol=1e-6)
+
     def error_metric(self, x):
         """Return the error between two arrays."""
         return np.linalg.norm(x - self.original)
@@ -208,6 +326,42 @@ class TestPtychoRecon(unittest.TestCase):
         """Check ptycho.solver.combined for consistency."""
         self.template_consistent_algorithm('combined')
 
+    def test_rpie_cost(self, fly=1):
+        """Check that ptycho.solver.rpie decreases the cost every epoch."""
+        scan, data = self.scan, self.data
+        if fly > 1:
+            # Each frame is a short horizontal fly scan
+            scan = scan[:, :, None] + np.linspace(0, 0.6, fly)[:, None] * [0, 1]
+            scan = scan.reshape(1, -1, 2).astype('float32')
+            data = tike.ptycho.simulate(
+                detector_shape=data.shape[-1],
+                probe=self.probe,
+                scan=scan,
+                psi=self.original,
+                fly=fly,
+            )
+        result = {
+            'psi': np.ones_like(self.original),
+            'probe': self.probe,
+            'scan': scan,
+        }
+        cost = []
+        for _ in range(5):
+            result = tike.ptycho.reconstruct(
+                **result,
+                data=data,
+                algorithm='rpie',
+                num_iter=1,
+                fly=fly,
+            )
+            cost.append(result['cost'])
+        assert np.all(np.diff(cost) < 0), cost
+        assert cost[-1] < 0.5 * cost[0], cost
+
+    def test_rpie_cost_fly(self):
+        """Check that ptycho.solver.rpie decreases the cost for fly scans."""
+        self.test_rpie_cost(fly=3)
+
     # def test_consistent_admm(self):
     #     """Check ptycho.solver.admm for consistency."""
     #     self.template_consistent_algorithm('admm')
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Test functions in tike.scan."""
+
+import numpy as np
+from tike.scan import *
+
+__author__ = "Daniel Ching"
+__copyright__ = "Copyright (c) 2020, UChicago Argonne, LLC."
+__docformat__ = 'restructuredtext en'
+
+
+def test_itrajectory():
+    """Check that streamed trajectories match whole trajectories."""
+    tkwargs = {'A': 1, 'B': 2, 'fx': 0.3, 'fy': 0.7, 'px': 0, 'py': 0.1}
+    t = scantimes(0, 10.5, 100)
+    x, y = lissajous(t=t, **tkwargs)
+    chunks = list(
+        itrajectory(lissajous, 0, 10.5, 100, chunk_size=128,
+                    tkwargs=tkwargs))
+    assert len(chunks) == 9
+    np.testing.assert_array_equal(np.concatenate([c[0] for c in chunks]), t)
+    np.testing.assert_array_equal(np.concatenate([c[1] for c in chunks]), x)
+    np.testing.assert_array_equal(np.concatenate([c[2] for c in chunks]), y)
+    np.testing.assert_allclose(np.concatenate(list(ilengths(chunks))),
+                               lengths(x, y))
+    np.testing.assert_allclose(list(idistance(chunks))[-1], distance(x, y))
+    np.testing.assert_allclose(
+        list(iavgspeed(chunks))[-1],
+        avgspeed(t[-1] - t[0], x, y),
+    )
+
+
+if __name__ == '__main__':
+    test_itrajectory()
@@ -23,6 +23,18 @@ def test_discrete_trajectory():
     np.testing.assert_equal(answer, truth)
 
 
+def test_discrete_trajectory_refined():
+    """Check trajectory.discrete_trajectory for a probe moving steadily."""
+    def linear(t):
+        """Probe moves along h at unit speed."""
+        return 0 * t, 0 * t, t
+
+    answer = discrete_trajectory(linear, tmin=0, tmax=1, xstep=0.1, tstep=1)
+    times = np.arange(16) / 16
+    truth = (0 * times, 0 * times, times, np.full(16, 1 / 16), times)
+    np.testing.assert_equal(answer, truth)
+
+
 def test_coded_exposure():
     """Check trajectory.coded_exposure for correctness."""
     c_time = np.arange(11)
@@ -48,6 +60,31 @@ def test_coded_exposure():
     np.testing.assert_equal(b1, [0, 1, 2, 4, 5, 7])
 
 
+def test_coverage():
+    """Check trajectory.coverage for a two pixel probe."""
+    H = coverage(theta=np.array([np.pi + 0.1]),
+                 v=np.array([-0.3]),
+                 h=np.array([0.2]),
+                 dwell=np.array([2.0]),
+                 bins=[2, 2, 2],
+                 probe_grid=[[1], [3]],
+                 probe_shape=(0.5, 0))
+    truth = np.zeros([2, 2, 2])
+    truth[0, 0, 1] = 2
+    truth[0, 1, 1] = 6
+    np.testing.assert_equal(H, truth)
+
+
+def test_bin_index():
+    """Check trajectory.bin_index at the edges of the range."""
+    index, inside = bin_index(np.array([-1, 0, 0.5, 1, 2]), 0, 1, 2)
+    np.testing.assert_equal(index, [0, 0, 1, 1, 1])
+    np.testing.assert_equal(inside, [False, True, True, True, False])
+
+
 if __name__ == '__main__':
     test_discrete_trajectory()
+    test_discrete_trajectory_refined()
     test_coded_exposure()
+    test_coverage()
+    test_bin_index()